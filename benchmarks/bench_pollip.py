@@ -0,0 +1,98 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Poll cost vs. fleet size for simple Listener._pollip.
+
+Compares the old full instances x fixed_ips join with the lookup of
+pending instances only. Nova database is emulated with sqlite.
+
+    $ python benchmarks/bench_pollip.py
+"""
+
+import os
+import sys
+import time
+import uuid
+
+import sqlalchemy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nova import flags
+from nova_dns.listener import simple
+
+FLAGS = flags.FLAGS
+
+FLEETS = (1000, 10000, 50000)
+PENDING = 10
+REPEAT = 5
+
+FULL_SCAN = """
+    select i.hostname, i.id, i.project_id, i.uuid, f.address
+    from instances i, fixed_ips f
+    where i.id=f.instance_id and i.deleted=0 and f.deleted=0"""
+
+
+def make_db(size):
+    engine = sqlalchemy.create_engine("sqlite://")
+    engine.execute("""create table instances (id integer primary key,
+        uuid varchar(36), hostname varchar(255), project_id varchar(255),
+        deleted integer default 0)""")
+    engine.execute("create index instances_uuid_idx on instances (uuid)")
+    engine.execute("""create table fixed_ips (id integer primary key,
+        address varchar(255), instance_id integer,
+        deleted integer default 0)""")
+    engine.execute("create index fixed_ips_instance_id on fixed_ips (instance_id)")
+    uuids = [str(uuid.uuid4()) for i in xrange(size)]
+    engine.execute("insert into instances (id, uuid, hostname, project_id) "
+        "values (?, ?, ?, ?)",
+        [(i + 1, u, "host%d" % i, "tenant") for i, u in enumerate(uuids)])
+    engine.execute("insert into fixed_ips (address, instance_id) values (?, ?)",
+        [("10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), i + 1)
+            for i in xrange(size)])
+    return engine, uuids
+
+
+def timeit(f):
+    best = None
+    for i in xrange(REPEAT):
+        start = time.time()
+        f()
+        spent = time.time() - start
+        best = spent if best is None else min(best, spent)
+    return best
+
+
+def main():
+    listener = simple.Listener.__new__(simple.Listener)
+    print "%10s %8s %14s %14s" % ("fleet", "pending", "full scan, ms", "pending, ms")
+    for size in FLEETS:
+        engine, uuids = make_db(size)
+        listener.conn = engine
+        pending = dict((u, 1) for u in uuids[-PENDING:])
+        full = timeit(lambda: [r for r in engine.execute(FULL_SCAN)
+            if r.uuid in pending])
+        targeted = timeit(lambda: listener._pending_instances(pending.keys()))
+        print "%10d %8d %14.2f %14.2f" % (size, PENDING, full * 1000,
+            targeted * 1000)
+
+
+if __name__ == '__main__':
+    main()
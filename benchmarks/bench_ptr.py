@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Lookups per second of ip => reverse zone mapping.
+
+Compares per-call parsing and linear scan of dns_ptr_zones (as
+Listener.ip2zone did) with prebuilt ReverseZones index.
+
+    $ python benchmarks/bench_ptr.py
+"""
+
+import os
+import random
+import sys
+import time
+
+import netaddr
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nova_dns.listener.simple.reverse import ReverseZones
+
+NETWORKS = (10, 100, 500)
+LOOKUPS = 20000
+
+
+def linear_ip2zone(ip, zones):
+    addr = netaddr.IPAddress(ip)
+    for zone in zones:
+        zoneaddr = netaddr.IPNetwork(zone)
+        if addr not in zoneaddr:
+            continue
+        cidr = str(zoneaddr.cidr).split('/')[1]
+        w = zoneaddr.cidr.ip.words
+        return ("%s-%s.%s.%s.%s.in-addr.arpa" %
+            (w[3], cidr, w[2], w[1], w[0]), addr.words[-1])
+    w = addr.words
+    return ("%s.%s.%s.in-addr.arpa" % (w[2], w[1], w[0]), w[3])
+
+
+def rate(f, ips):
+    start = time.time()
+    for ip in ips:
+        f(ip)
+    return len(ips) / (time.time() - start)
+
+
+def main():
+    random.seed(0)
+    print "%10s %16s %16s" % ("networks", "linear, ops/s", "index, ops/s")
+    for count in NETWORKS:
+        #/26 classless delegations in 10.0.0.0/8
+        zones = ["10.%d.%d.%d/26" % (i >> 10 & 255, i >> 2 & 255, (i & 3) * 64)
+            for i in xrange(count)]
+        ips = ["10.%d.%d.%d" % (i >> 10 & 255, i >> 2 & 255,
+            (i & 3) * 64 + random.randint(0, 63))
+            for i in (random.randint(0, count * 2) for n in xrange(LOOKUPS))]
+        index = ReverseZones(zones)
+        linear = rate(lambda ip: linear_ip2zone(ip, zones), ips[:LOOKUPS / 10])
+        indexed = rate(index.lookup, ips)
+        print "%10d %16d %16d" % (count, linear, indexed)
+
+
+if __name__ == '__main__':
+    main()
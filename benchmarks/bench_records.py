@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Cost of DNSRecord objects on read paths: creating records for rows read
+from database, size of record and serialising list of records to JSON.
+
+Compares plain class with __dict__ and validation of every row (as
+DNSRecord was) with __slots__ DNSRecord and its from_db() fast path.
+Replies of plain class are built from its __dict__, DNSRecord builds a
+new dict by to_dict(), so JSON of DNSRecord is slower.
+
+    $ python benchmarks/bench_records.py
+"""
+
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from nova_dns.dnsmanager import DNSRecord, record_types
+
+ROWS = 100000
+
+
+class PlainRecord:
+    def __init__(self, name, type, content, priority=None, ttl=None):
+        self.name = PlainRecord.normname(name)
+        self.type = PlainRecord.normtype(type)
+        self.content = content
+        self.priority = int(priority) if priority else 0
+        self.ttl = int(ttl) if ttl else 7200
+
+    @staticmethod
+    def normtype(type):
+        t = str(type).upper()
+        if t not in record_types:
+            raise ValueError("Incorrect type: " + type)
+        return t
+
+    @staticmethod
+    def normname(n):
+        name = str(n).lower()
+        if name == "" or name == "*" or \
+                re.match(r'\A(?:[\w\d-]+\.)*(?:[\w\d-]+)\Z', name):
+            return name
+        raise ValueError("Incorrect DNS name: " + name)
+
+
+def rate(f, rows):
+    start = time.time()
+    res = [f(*row) for row in rows]
+    return (len(rows) / (time.time() - start), res)
+
+
+def serialise(records):
+    start = time.time()
+    if hasattr(records[0], "__slots__"):
+        json.dumps([r.to_dict() for r in records])
+    else:
+        json.dumps([r.__dict__ for r in records])
+    return len(records) / (time.time() - start)
+
+
+def total(*rates):
+    """rate of operations done one after another"""
+    return 1 / sum(1.0 / r for r in rates)
+
+
+def size(r):
+    if hasattr(r, "__slots__"):
+        return sys.getsizeof(r)
+    return sys.getsizeof(r) + sys.getsizeof(r.__dict__)
+
+
+def main():
+    rows = [(u"host%d.example.com" % i, u"A",
+        u"10.%d.%d.%d" % (i >> 16 & 255, i >> 8 & 255, i & 255), 0, 300)
+        for i in xrange(ROWS)]
+    print "%-24s %12s %14s %12s %14s" % ("", "rows/s", "bytes/record",
+        "json rec/s", "rows+json/s")
+    for (name, f) in (("plain class", PlainRecord),
+            ("DNSRecord (validated)", DNSRecord),
+            ("DNSRecord.from_db", DNSRecord.from_db)):
+        (created, records) = rate(f, rows)
+        serialised = serialise(records)
+        print "%-24s %12d %14d %12d %14d" % (name, created, size(records[0]),
+            serialised, total(created, serialised))
+
+
+if __name__ == '__main__':
+    main()
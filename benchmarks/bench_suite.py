@@ -0,0 +1,323 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Benchmark suite:
+ - REST API: nova_dns.dns.App driven through WSGI in-process
+ - AMQP: synthetic run_instance/terminate_instance streams replayed
+   through amqp.Service.process_message into simple Listener, nova
+   database is emulated with sqlite
+ - PowerDNS backend: PowerDNSZone on sqlite
+ - blocking: REST latency while listener runs heavy nova queries in
+   another green thread, with and without dns_db_threadpool
+Every operation is measured at several zone sizes: ops/sec, p50/p99
+latency and SQL statements per operation.
+
+    $ python benchmarks/bench_suite.py --save new.json --compare old.json
+    $ python benchmarks/bench_suite.py --backend memory --sizes 100,10000
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import urllib
+import uuid
+import optparse
+
+import sqlalchemy
+import webob
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import harness
+
+from nova import flags
+
+FLAGS = flags.FLAGS
+
+BACKENDS = {
+    "powerdns": "nova_dns.dnsmanager.powerdns.Manager",
+    "memory": "nova_dns.dnsmanager.memory.Manager",
+}
+
+
+def setup(tmpdir, backend):
+    """configure flags before nova_dns modules are imported, PowerDNS
+    tables are created on import"""
+    FLAGS.dns_sql_connection = "sqlite:///%s/pdns.db" % tmpdir
+    FLAGS.sql_connection = "sqlite:///%s/nova.db" % tmpdir
+    FLAGS.dns_manager = BACKENDS[backend]
+    FLAGS.dns_auth = "none"
+    FLAGS.dns_reconcile = False
+    FLAGS.dns_coalesce_window = 0
+    FLAGS.dns_ptr = True
+
+
+def engines(backend):
+    if backend != "powerdns":
+        return []
+    from nova_dns.dnsmanager.powerdns.session import get_engine
+    return [get_engine()]
+
+
+def fill(manager, zone_name, size):
+    from nova_dns.dnsmanager import DNSRecord
+    if zone_name in manager.list():
+        manager.drop(zone_name, force=True)
+    manager.add(zone_name)
+    zone = manager.get(zone_name)
+    for i in xrange(0, size, 1000):
+        zone.add_many([DNSRecord("host%d" % n, "A", ip(n))
+            for n in xrange(i, min(size, i + 1000))])
+    manager.release()
+
+
+def ip(n):
+    return "10.%d.%d.%d" % (n >> 16 & 255, n >> 8 & 255, n & 255)
+
+
+def bench_rest(backend, sizes, count):
+    from nova_dns import dns
+    app = dns.VersionFilter(dns.App())
+    manager = dns.Controller().manager
+    counter = harness.QueryCounter(*engines(backend))
+
+    def call(method, path, params=None, body=None):
+        req = webob.Request.blank(path + ("?" + urllib.urlencode(params)
+            if params else ""))
+        req.method = method
+        if body is not None:
+            req.body = json.dumps(body)
+        res = req.get_response(app)
+        if json.loads(res.body)["error"]:
+            raise Exception("%s %s: %s" % (method, path, res.body))
+
+    results = []
+    for size in sizes:
+        zone = "rest%d.localzone" % size
+        fill(manager, zone, size)
+        names = range(count)
+        ops = [
+            ("GET /zone/{zone}", lambda n: call("GET", "/zone/" + zone)),
+            ("GET /record/{zone}?name", lambda n: call("GET",
+                "/record/" + zone, {"name": "host%d" % (n * 7 % size)})),
+            ("GET /record/{zone}?limit", lambda n: call("GET",
+                "/record/" + zone, {"limit": 100})),
+            ("PUT /record (add)", lambda n: call("PUT",
+                "/record/%s/new%d/A/%s" % (zone, n, ip(n)))),
+            ("POST /record (edit)", lambda n: call("POST",
+                "/record/%s/new%d/A" % (zone, n), {"content": ip(n + 1)})),
+            ("DELETE /record", lambda n: call("DELETE",
+                "/record/%s/new%d/A" % (zone, n))),
+            ("POST /record/ (batch 10)", lambda n: call("POST", "/record/",
+                body={zone: [{"action": "add", "name": "b%d-%d" % (n, i),
+                "type": "A", "content": ip(i)} for i in xrange(10)]})),
+        ]
+        for (name, fn) in ops:
+            results.append(harness.measure(name, size, fn, names, counter))
+        #whole zone is heavy, measure it less
+        results.append(harness.measure("GET /record/{zone}", size,
+            lambda n: call("GET", "/record/" + zone), range(max(1, count / 20)),
+            counter))
+        manager.drop(zone, force=True)
+        manager.release()
+    return results
+
+
+class Message(object):
+    delivery_info = {"routing_key": "compute.bench"}
+
+    def ack(self):
+        pass
+
+    def requeue(self):
+        raise Exception("message was requeued")
+
+
+def nova_db(size):
+    engine = sqlalchemy.create_engine(FLAGS.sql_connection)
+    engine.execute("drop table if exists instances")
+    engine.execute("drop table if exists fixed_ips")
+    engine.execute("""create table instances (id integer primary key,
+        uuid varchar(36), hostname varchar(255), project_id varchar(255),
+        vm_state varchar(255), deleted integer)""")
+    engine.execute("create index instances_uuid_idx on instances (uuid)")
+    engine.execute("""create table fixed_ips (id integer primary key,
+        address varchar(255), instance_id integer, deleted integer)""")
+    engine.execute("create index fixed_ips_instance_id on fixed_ips (instance_id)")
+    uuids = [str(uuid.uuid4()) for i in xrange(size)]
+    engine.execute("insert into instances values (?, ?, ?, ?, ?, 0)",
+        [(i + 1, u, "vm%d" % i, "bench", "building")
+            for i, u in enumerate(uuids)])
+    engine.execute("insert into fixed_ips (address, instance_id, deleted) "
+        "values (?, ?, 0)", [(ip(i), i + 1) for i in xrange(size)])
+    return uuids
+
+
+def bench_amqp(backend, sizes, count):
+    from nova_dns import amqp
+    from nova_dns.listener import simple
+    results = []
+    for size in sizes:
+        uuids = nova_db(size)
+        listener = simple.Listener()
+        service = amqp.Service.__new__(amqp.Service)
+        service.listener = listener
+        service.queues = [amqp.eventlet.queue.LightQueue()
+            for i in xrange(FLAGS.dns_amqp_workers)]
+        counter = harness.QueryCounter(listener.conn, *engines(backend))
+
+        def replay(body):
+            service.process_message(body, Message())
+            for queue in service.queues:
+                while queue.qsize():
+                    service.handle(*queue.get())
+
+        results.append(harness.measure("amqp run_instance", size, replay,
+            [{"method": "run_instance", "args": {"instance_uuid": u}}
+                for u in uuids], counter))
+        #all instances got ip at once
+        results.append(harness.measure("listener poll (all)", size,
+            lambda uuids: listener._poll(uuids), [list(listener.pending)],
+            counter))
+        listener.dnsmanager.release()
+        results.append(harness.measure("amqp terminate_instance", size,
+            replay, [{"method": "terminate_instance",
+                "args": {"instance_uuid": u}} for u in uuids[:count]],
+            counter))
+        listener.dnsmanager.release()
+    return results
+
+
+#stands for slow join of big nova database
+HEAVY_SQL = """with recursive c(x) as (select 1 union all select x + 1
+    from c where x < 300000) select count(*) from c"""
+
+
+def bench_blocking(backend, count):
+    import eventlet
+    from nova_dns import dns
+    from nova_dns.listener import simple
+    nova_db(1)
+    results = []
+    for threadpool in (False, True):
+        FLAGS.dns_db_threadpool = threadpool
+        app = dns.VersionFilter(dns.App())
+        manager = dns.Controller().manager
+        listener = simple.Listener()
+        zone = "blocking.localzone"
+        fill(manager, zone, 1000)
+        running = [True]
+
+        def heavy():
+            while running[0]:
+                listener._select(HEAVY_SQL)
+                eventlet.sleep(0)
+
+        def call(n):
+            #requests are served between other green threads' work
+            eventlet.sleep(0)
+            req = webob.Request.blank("/record/%s?name=host%d" % (zone, n))
+            if json.loads(req.get_response(app).body)["error"]:
+                raise Exception("GET /record/%s failed" % zone)
+
+        worker = eventlet.spawn(heavy)
+        results.append(harness.measure(
+            "GET /record, busy nova db" + (" (tpool)" if threadpool else ""),
+            1000, call, range(max(1, count / 10))))
+        running[0] = False
+        worker.wait()
+        manager.drop(zone, force=True)
+        manager.release()
+    FLAGS.dns_db_threadpool = False
+    return results
+
+
+def bench_powerdns(sizes, count):
+    from nova_dns.dnsmanager import DNSRecord
+    from nova_dns.dnsmanager import powerdns
+    manager = powerdns.Manager()
+    counter = harness.QueryCounter(*engines("powerdns"))
+    results = []
+    for size in sizes:
+        zone_name = "pdns%d.localzone" % size
+        fill(manager, zone_name, size)
+        zone = manager.get(zone_name)
+        names = range(count)
+        ops = [
+            ("PowerDNSZone.get(name)",
+                lambda n: zone.get("host%d" % (n * 7 % size))),
+            ("PowerDNSZone.page(100)", lambda n: zone.page(limit=100)),
+            ("PowerDNSZone.add", lambda n: zone.add(
+                DNSRecord("new%d" % n, "A", ip(n)))),
+            ("PowerDNSZone.set", lambda n: zone.set("new%d" % n, "A",
+                ip(n + 1))),
+            ("PowerDNSZone.delete", lambda n: zone.delete("new%d" % n, "A")),
+            ("PowerDNSZone.batch(10)", lambda n: zone.batch([("add",
+                DNSRecord("b%d-%d" % (n, i), "A", ip(i)))
+                for i in xrange(10)])),
+        ]
+        for (name, fn) in ops:
+            results.append(harness.measure(name, size, fn, names, counter))
+        manager.drop(zone_name, force=True)
+        manager.release()
+    return results
+
+
+def main():
+    parser = optparse.OptionParser(usage="%prog [options]")
+    parser.add_option("--backend", default="powerdns",
+        help="dns backend for REST and AMQP: %s" % ", ".join(BACKENDS))
+    parser.add_option("--sizes", default="100,1000,10000",
+        help="zone sizes, comma separated")
+    parser.add_option("--count", type="int", default=200,
+        help="operations per measurement")
+    parser.add_option("--only", default="rest,amqp,powerdns,blocking",
+        help="benchmarks to run")
+    parser.add_option("--save", help="save results to json file")
+    parser.add_option("--compare", help="compare with saved results")
+    (options, args) = parser.parse_args()
+    sizes = [int(s) for s in options.sizes.split(",")]
+    only = options.only.split(",")
+    tmpdir = tempfile.mkdtemp()
+    try:
+        setup(tmpdir, options.backend)
+        results = []
+        if "rest" in only:
+            results.extend(bench_rest(options.backend, sizes, options.count))
+        if "amqp" in only:
+            results.extend(bench_amqp(options.backend, sizes, options.count))
+        if "powerdns" in only:
+            results.extend(bench_powerdns(sizes, options.count))
+        if "blocking" in only:
+            results.extend(bench_blocking(options.backend, options.count))
+    finally:
+        shutil.rmtree(tmpdir)
+    harness.print_results(results,
+        harness.load(options.compare) if options.compare else None)
+    if options.save:
+        harness.save(results, options.save, backend=options.backend,
+            sizes=sizes, count=options.count)
+
+
+if __name__ == '__main__':
+    main()
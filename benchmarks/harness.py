@@ -0,0 +1,99 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Helpers for benchmarks: latency/throughput measurement, SQL statement
+counting, result tables and JSON files to compare runs.
+"""
+
+import json
+import time
+
+import sqlalchemy.event
+
+
+class QueryCounter(object):
+    """counts statements executed by sqlalchemy ``engines``"""
+    def __init__(self, *engines):
+        self.count = 0
+        for engine in engines:
+            sqlalchemy.event.listen(engine, "before_cursor_execute",
+                self._execute)
+
+    def _execute(self, conn, cursor, statement, parameters, context,
+            executemany):
+        self.count += 1
+
+
+def percentile(values, p):
+    """``p`` percentile of sorted ``values``"""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(len(values) * p / 100.0))]
+
+
+def measure(name, size, fn, args, counter=None):
+    """call ``fn`` for every item of ``args``, return result dict"""
+    latencies = []
+    queries = counter.count if counter else 0
+    start = time.time()
+    for arg in args:
+        t = time.time()
+        fn(arg)
+        latencies.append(time.time() - t)
+    total = time.time() - start
+    latencies.sort()
+    n = len(latencies)
+    return {
+        "name": name,
+        "size": size,
+        "ops": n,
+        "ops_per_sec": n / total if total else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries_per_op": float(counter.count - queries) / n
+            if counter and n else 0.0,
+    }
+
+
+def print_results(results, baseline=None):
+    """table of results, with ops/sec change against ``baseline``
+    results (from load())"""
+    old = dict(((r["name"], r["size"]), r) for r in baseline or [])
+    print "%-28s %7s %7s %11s %9s %9s %9s %8s" % ("operation", "size", "ops",
+        "ops/sec", "p50, ms", "p99, ms", "queries", "change")
+    for r in results:
+        change = ""
+        prev = old.get((r["name"], r["size"]))
+        if prev and prev["ops_per_sec"]:
+            change = "%+.0f%%" % ((r["ops_per_sec"] / prev["ops_per_sec"]
+                - 1) * 100)
+        print "%-28s %7d %7d %11.1f %9.3f %9.3f %9.2f %8s" % (r["name"],
+            r["size"], r["ops"], r["ops_per_sec"], r["p50_ms"], r["p99_ms"],
+            r["queries_per_op"], change)
+
+
+def save(results, filename, **info):
+    with open(filename, "w") as f:
+        json.dump(dict(info, time=time.time(), results=results), f, indent=1)
+
+
+def load(filename):
+    with open(filename) as f:
+        return json.load(f)["results"]
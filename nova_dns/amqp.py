@@ -25,6 +25,7 @@ import time
 import socket
 
 import eventlet
+import eventlet.queue
 import json
 
 import kombu
@@ -35,15 +36,35 @@ import kombu.connection
 from nova import exception
 from nova import utils
 from nova import flags
+from nova.openstack.common import cfg
 from nova import log as logging
+from nova_dns import metrics
 
 
 LOG = logging.getLogger("nova_dns.listener")
 FLAGS = flags.FLAGS
 
+opts = [
+    cfg.ListOpt("dns_routing_keys", default=["compute.#"],
+			help="Routing keys to listen, add 'network.#' to react on "
+			"fixed ip allocation and floating ips changes"),
+    cfg.IntOpt("dns_amqp_workers", default=8,
+			help="Number of green threads processing AMQP messages"),
+    cfg.IntOpt("dns_amqp_prefetch", default=64,
+			help="Max number of received but not processed AMQP messages"),
+    cfg.IntOpt("dns_amqp_retries", default=3,
+			help="Number of times failed message is processed again "
+			"before it is requeued")
+]
+FLAGS.register_opts(opts)
+
+#first retry delay in seconds, doubled on every next retry
+RETRY_DELAY = 0.1
+
 class Service(object):
     """
-    listens for ``compute.#`` routing keys.
+    listens for ``FLAGS.dns_routing_keys`` (``compute.#`` by default)
+    routing keys.
     """
     def __init__(self):
         self.params = dict(hostname=FLAGS.rabbit_host,
@@ -53,8 +74,17 @@ class Service(object):
                           virtual_host=FLAGS.rabbit_virtual_host)
         self.connection = None
         self.eventlet = None
+        if FLAGS.dns_amqp_workers < 1:
+            raise Exception("dns_amqp_workers must be at least 1, not %s" %
+                FLAGS.dns_amqp_workers)
         listener_class = utils.import_class(FLAGS.dns_listener);
         self.listener = listener_class()
+        #messages are sharded between workers by instance
+        self.queues = [eventlet.queue.LightQueue()
+            for i in xrange(FLAGS.dns_amqp_workers)]
+        self.workers = []
+        metrics.METRICS.gauge("nova_dns_amqp_queued_messages",
+            lambda: sum(queue.qsize() for queue in self.queues))
 
     def reconnect(self):
         if self.connection:
@@ -82,18 +112,88 @@ class Service(object):
         self.queue = kombu.entity.Queue(
             name="nova_dns",
             exchange=exchange,
-            routing_key="compute.#",
+            routing_key=FLAGS.dns_routing_keys[0],
             channel=self.channel,
             **options)
+        if len(FLAGS.dns_routing_keys) > 1:
+            self.queue.declare()
+            for routing_key in FLAGS.dns_routing_keys[1:]:
+                self.queue.bind_to(exchange=exchange.name,
+                    routing_key=routing_key)
         LOG.debug("created kombu connection: %s" % self.params)
 
     def process_message(self, body, message):
+        """
+        Pass message to one of workers. Messages about the same instance
+        (or floating ip) always go to the same worker, so they are
+        processed in order.
+        """
+        try:
+            args = body["args"]
+            key = (args.get("instance_uuid", None) or
+                args.get("instance_id", None) or
+                args.get("floating_address", None))
+        except (KeyError, AttributeError, TypeError):
+            key = None
+        self.queues[hash(key) % len(self.queues)].put((body, message))
+
+    def handle(self, body, message):
+        """
+        Process message and ack it. Failed processing is retried in place
+        up to ``FLAGS.dns_amqp_retries`` times, so next messages about the
+        same instance aren't processed before it. Then message is requeued.
+        """
+        try:
+            method = str(body["method"])
+        except (KeyError, TypeError):
+            method = "<unknown>"
+        start = time.time()
+        prev_operation = metrics.set_operation("amqp:" + method)
         try:
-            self.process_event(body, message)
-        except KeyError, ex:
-            LOG.exception("cannot handle message")
+            result = self.retry(body, message)
+        finally:
+            metrics.METRICS.observe("nova_dns_amqp_event_seconds",
+                time.time() - start, method=method)
+            metrics.set_operation(prev_operation)
+        metrics.METRICS.inc("nova_dns_amqp_events_total", method=method,
+            result=result)
+        if result == "requeued":
+            message.requeue()
+            return
         message.ack()
 
+    def retry(self, body, message):
+        """
+        Process message, return "ok", "failed" (can't be processed) or
+        "requeued" (retries are exhausted). Only this worker waits between
+        retries, with exponential backoff from RETRY_DELAY.
+        """
+        attempt = 0
+        while True:
+            try:
+                self.process_event(body, message)
+                return "ok"
+            except KeyError, ex:
+                LOG.exception("cannot handle message")
+                return "failed"
+            except Exception:
+                if attempt >= FLAGS.dns_amqp_retries:
+                    LOG.exception("failed to process message, requeue it")
+                    return "requeued"
+                LOG.exception("failed to process message, retry it")
+            eventlet.sleep(RETRY_DELAY * 2 ** attempt)
+            attempt += 1
+
+    def work(self, queue):
+        while True:
+            (body, message) = queue.get()
+            try:
+                self.handle(body, message)
+            except Exception:
+                #e.g. channel was closed by reconnect, message will be
+                #redelivered
+                LOG.exception("cannot ack message")
+
     def process_event(self, body, message):
         """
         This function receive ``body`` and pass it to listener manager
@@ -117,6 +217,7 @@ class Service(object):
                     channel=self.channel,
                     queues=self.queue,
                     callbacks=[self.process_message]) as consumer:
+                    consumer.qos(prefetch_count=FLAGS.dns_amqp_prefetch)
                     while True:
                         self.connection.drain_events()
             except socket.error:
@@ -126,9 +227,13 @@ class Service(object):
                         '%s' % str(e)))
 
     def start(self):
+        self.workers = [eventlet.spawn(self.work, queue)
+            for queue in self.queues]
         self.eventlet = eventlet.spawn(self.consume)
 
     def stop(self):
+        for worker in self.workers:
+            worker.kill()
         self.eventlet.stop()
 
     def wait(self):
@@ -22,24 +22,73 @@ Authorization
 """
 
 
+import calendar
+import collections
 import ConfigParser
+import time
+
+import eventlet
+import eventlet.event
 
 from nova import flags
+from nova import log as logging
+from nova import utils
 from nova.openstack.common import cfg
 from keystoneclient.v2_0 import client as keystone_client
+from keystoneclient import exceptions as keystone_exceptions
 from dnsmanager import DNSRecord
 
+LOG = logging.getLogger("nova_dns.auth")
 FLAGS = flags.FLAGS
 
 opts = [
     cfg.StrOpt("dns_auth", default="keystone", help="Auth mode in REST API"),
     cfg.StrOpt("dns_auth_role", default="DNS_Admin", help="Role name in REST API"),
     cfg.StrOpt("dns_nova_auth", default="keystone", help="Auth mode in Nova"),
-    cfg.StrOpt("dns_zone", default="localzone", help="Nova DNS base zone")
+    cfg.StrOpt("dns_zone", default="localzone", help="Nova DNS base zone"),
+    cfg.IntOpt("dns_auth_cache_size", default=1000,
+        help="Max number of validated tokens in cache"),
+    cfg.IntOpt("dns_auth_cache_ttl", default=300,
+        help="Max seconds to trust validated token without asking keystone"),
+    cfg.IntOpt("dns_auth_tenant_refresh", default=300,
+        help="Seconds between reloads of all tenants from keystone, 0 to disable"),
+    cfg.IntOpt("dns_auth_tenant_negative_ttl", default=60,
+        help="Seconds to remember that tenant id is unknown"),
+    cfg.IntOpt("dns_auth_tenant_negative_size", default=1000,
+        help="Max number of remembered unknown tenant ids")
 ]
 FLAGS.register_opts(opts)
 
 
+class LRUCache(object):
+    """
+    Dict of at most ``size`` items. Every item has its own expiration
+    time, least recently used items are evicted first.
+    """
+    def __init__(self, size):
+        self.size = size
+        self.items = collections.OrderedDict()
+
+    def get(self, key):
+        try:
+            (value, expires) = self.items.pop(key)
+        except KeyError:
+            return None
+        if expires <= time.time():
+            return None
+        self.items[key] = (value, expires)
+        return value
+
+    def set(self, key, value, expires):
+        self.items.pop(key, None)
+        self.items[key] = (value, expires)
+        while len(self.items) > self.size:
+            self.items.popitem(last=False)
+
+    def __len__(self):
+        return len(self.items)
+
+
 
 class NoAuth(object):
     def tenant2zonename(self, project_id):
@@ -59,6 +108,12 @@ class KeystoneAuth(NoAuth):
         self.client = keystone_client.Client(
             endpoint=self.url, token=self.token)
         self.tenants = {}
+        #unknown tenant ids, so bogus id doesn't cost keystone request
+        self.unknown = LRUCache(FLAGS.dns_auth_tenant_negative_size)
+        #tenant id => event of lookup in progress
+        self.lookups = {}
+        #started on first lookup - AUTH is created at import time
+        self.refresher = None
 
     def tenant2zonename(self, project_id):
         #project_id is a really project_id :)
@@ -78,16 +133,108 @@ class KeystoneAuth(NoAuth):
 
 
     def _get_tenant(self, id):
-        if not self.tenants.has_key(id):
-            #probably new tenant, let's re-read cache
-            self.tenants={}
-            for t in self.client.tenants.list():
-                self.tenants[t.id] = t.name
+        if self.refresher is None and FLAGS.dns_auth_tenant_refresh:
+            self.refresher = eventlet.spawn(self._refresh_tenants)
         name = self.tenants.get(id, None)
+        if name:
+            return name
+        if self.unknown.get(id):
+            raise ValueError('Unknown tenant_id: %s' % (str(id)))
+        if id in self.lookups:
+            #somebody is already asking keystone about this id, their
+            #error is raised here too
+            name = self.lookups[id].wait()
+        else:
+            event = self.lookups[id] = eventlet.event.Event()
+            try:
+                name = self._fetch_tenant(id)
+            except Exception as e:
+                #keystone failure isn't "unknown tenant", nothing is cached
+                LOG.exception("Failed to get tenant %s from keystone" % (id,))
+                del self.lookups[id]
+                event.send_exception(e)
+                raise
+            del self.lookups[id]
+            event.send(name)
         if not name:
-            #nope, not new
             raise ValueError('Unknown tenant_id: %s' % (str(id)))
         return name
 
-AUTH = NoAuth() if FLAGS.dns_auth == 'none' else KeystoneAuth()
+    def _fetch_tenant(self, id):
+        try:
+            name = self.client.tenants.get(id).name
+        except keystone_exceptions.NotFound:
+            self.unknown.set(id, True,
+                time.time() + FLAGS.dns_auth_tenant_negative_ttl)
+            return None
+        self.tenants[id] = name
+        return name
+
+    def _refresh_tenants(self):
+        while True:
+            try:
+                self.tenants = dict((t.id, t.name)
+                    for t in self.client.tenants.list())
+            except Exception:
+                LOG.exception("Failed to load tenants from keystone")
+            eventlet.sleep(FLAGS.dns_auth_tenant_refresh)
+
+class TokenAuth(KeystoneAuth):
+    """
+    Validates X-Auth-Token header with keystone itself, so keystone
+    middleware isn't needed in api-paste pipeline. Validated tokens are
+    cached until they expire (but no longer than FLAGS.dns_auth_cache_ttl).
+    """
+    def __init__(self):
+        super(TokenAuth, self).__init__()
+        self.tokens = LRUCache(FLAGS.dns_auth_cache_size)
+
+    def can(self, req, zone_name):
+        (roles, name) = self._validate(req.headers.get('X-Auth-Token', None))
+        if "Admin" in roles:
+            return {"read":True, "write":True}
+        if FLAGS.dns_auth_role not in roles or not name:
+            return {"read":True, "write":False}
+        can_write = DNSRecord.normname(zone_name) == name
+        return {"read":True, "write":can_write}
+
+    def _validate(self, token):
+        """return (roles, zone name of token's tenant)"""
+        if not token:
+            raise Exception('unauthorized')
+        v = self.tokens.get(token)
+        if v is not None:
+            return v
+        try:
+            (resp, body) = self.client.get('/tokens/%s' % (token,))
+        except keystone_exceptions.ClientException:
+            raise Exception('unauthorized')
+        access = body["access"]
+        roles = [r["name"] for r in access["user"].get("roles", [])]
+        tenant = access["token"].get("tenant", None)
+        name = None
+        #tenant name is checked only if it can be used as zone name
+        if tenant and FLAGS.dns_auth_role in roles and "Admin" not in roles:
+            try:
+                name = DNSRecord.normname(
+                    NoAuth.tenant2zonename(self, tenant["name"]))
+            except ValueError:
+                LOG.warn("Tenant name %r can't be used as zone name"
+                    % (tenant["name"],))
+        expires = time.time() + FLAGS.dns_auth_cache_ttl
+        try:
+            expires = min(expires, calendar.timegm(utils.parse_isotime(
+                access["token"]["expires"]).utctimetuple()))
+        except (KeyError, ValueError):
+            pass
+        v = (roles, name)
+        self.tokens.set(token, v, expires)
+        return v
+
+if FLAGS.dns_auth == 'none':
+    AUTH = NoAuth()
+elif FLAGS.dns_auth == 'token':
+    AUTH = TokenAuth()
+else:
+    AUTH = KeystoneAuth()
 
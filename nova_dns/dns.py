@@ -22,7 +22,10 @@ DNS rest service
 """
 
 import eventlet
+import hashlib
 import json
+import sys
+import time
 
 from nova import flags
 from nova.openstack.common import cfg
@@ -36,8 +39,11 @@ import routes.middleware
 from nova import wsgi
 from nova import service
 from nova_dns import __version__
-from nova_dns.dnsmanager import DNSRecord, DNSSOARecord
-from nova_dns.auth import AUTH
+from nova_dns import metrics
+from nova_dns import zonefile
+from nova_dns.dnsmanager import DNSRecord, DNSSOARecord, SERIALS
+from nova_dns.dnsmanager.threadpool import ThreadPoolManager
+from nova_dns.auth import AUTH, LRUCache
 
 LOG = logging.getLogger("nova_dns.dns")
 FLAGS = flags.FLAGS
@@ -45,7 +51,18 @@ FLAGS = flags.FLAGS
 opts = [
     cfg.StrOpt("dns_listen", default="0.0.0.0",
 			help="IP address for DNS API to listen"),
-    cfg.IntOpt("dns_listen_port", default=15353, help="DNS API port")
+    cfg.IntOpt("dns_listen_port", default=15353, help="DNS API port"),
+    cfg.IntOpt("dns_response_cache_size", default=100,
+			help="Number of cached records list replies, 0 - no cache"),
+    cfg.IntOpt("dns_response_cache_bytes", default=10485760,
+			help="Max total size of cached records list replies"),
+    cfg.IntOpt("dns_changes_max_wait", default=60,
+			help="Max seconds to wait for zone changes in one request"),
+    cfg.FloatOpt("dns_changes_poll_interval", default=1,
+			help="Seconds between checks of zone serial while waiting "
+			"for changes"),
+    cfg.BoolOpt("dns_metrics_public", default=False,
+			help="Serve GET /metrics without authorization")
 ]
 FLAGS.register_opts(opts)
 
@@ -87,6 +104,58 @@ class VersionFilter(object):
         return filter
 
 
+class ReplyCache(LRUCache):
+    """
+    LRUCache of reply bodies, bounded by total size of bodies too.
+    Body bigger than ``max_bytes`` isn't cached at all
+    """
+    def __init__(self, size, max_bytes):
+        super(ReplyCache, self).__init__(size)
+        self.max_bytes = max_bytes
+        self.bytes = 0
+
+    def get(self, key):
+        item = self.items.get(key)
+        value = super(ReplyCache, self).get(key)
+        if item is not None and value is None:
+            #expired item was dropped
+            self.bytes -= len(item[0])
+        return value
+
+    def set(self, key, value, expires):
+        if len(value) > self.max_bytes:
+            return
+        item = self.items.pop(key, None)
+        if item is not None:
+            self.bytes -= len(item[0])
+        self.items[key] = (value, expires)
+        self.bytes += len(value)
+        while len(self.items) > self.size or self.bytes > self.max_bytes:
+            (value, expires) = self.items.popitem(last=False)[1]
+            self.bytes -= len(value)
+
+
+class ClosingIter(object):
+    """
+    app_iter calling ``release`` when server closes reply. finally of
+    generator doesn't run if client is gone before first chunk, but
+    close() is always called (PEP 333)
+    """
+    def __init__(self, iterable, release):
+        self.iterable = iterable
+        self.release = release
+
+    def __iter__(self):
+        return iter(self.iterable)
+
+    def close(self):
+        try:
+            if hasattr(self.iterable, "close"):
+                self.iterable.close()
+        finally:
+            self.release()
+
+
 class Controller(object):
     """
     WSGI application that reads routing information supplied by ``RoutesMiddleware``
@@ -96,30 +165,61 @@ class Controller(object):
     def __init__(self):
         manager_class=utils.import_class(FLAGS.dns_manager);
         self.manager=manager_class()
+        if FLAGS.dns_db_threadpool:
+            self.manager=ThreadPoolManager(self.manager)
+        #(zone name, serial, query) => reply body
+        self.responses=ReplyCache(FLAGS.dns_response_cache_size,
+            FLAGS.dns_response_cache_bytes)
 
     @webob.dec.wsgify
     def __call__(self, req):
         """
         """
+        #streaming reply reads backend after return
+        streaming = False
+        start = time.time()
+        action = "unknown"
+        prev_operation = metrics.set_operation(None)
         try:
             args = req.environ["wsgiorg.routing_args"][1]
             action = args["action"]
-            if action in ('index', 'zone_get', 'list'):
+            metrics.set_operation(action)
+            if action in ('index', 'zone_get', 'list', 'zone_export',
+                    'zone_changes', 'metrics'):
                 action_type = "read"
             else:
                 action_type = "write"
-            #TODO remove keystone middleware and directly authenticate
-            #with keystoneclient.tokens.authneticate - right now this is
-            #buggy - if token incorect, keystonectlient return amazing
-            #error 'maximum recursion depth exceeded in cmp'
-            if not AUTH.can(req, args.get('zonename', ''))[action_type]:
+            #with dns_auth=token tokens are validated (and cached) by
+            #nova_dns.auth itself and keystone middleware can be removed
+            #from pipeline
+            #batch is authorized per zone
+            public = action=="metrics" and FLAGS.dns_metrics_public
+            if action!="batch" and not public and \
+                not AUTH.can(req, args.get('zonename', ''))[action_type]:
                 raise Exception('unauthorized')
             result={}
+            #zone serial is version of reads: ETag, reply cache key
+            etag=None
+            cache_key=None
+            if action in ("zone_get", "list", "zone_export"):
+                serial=self._serial(args['zonename'])
+                etag='"%s"' % serial
+                if self._not_modified(req, etag):
+                    return self._reply(None, etag, status=304)
+                if action=="list" and not req.GET.get('stream', None) and \
+                        FLAGS.dns_response_cache_size:
+                    cache_key=(args['zonename'], serial, req.query_string)
+                    body=self.responses.get(cache_key)
+                    if body is not None:
+                        return self._reply(body, etag)
 
-            if action=="index":
+            if action=="metrics":
+                return webob.Response(metrics.METRICS.render(),
+                    content_type='text/plain; version=0.0.4')
+            elif action=="index":
                 result=self.manager.list()
             elif action=="zone_get":
-                result=self.manager.get(args['zonename']).get_soa().__dict__
+                result=self.manager.get(args['zonename']).get_soa().to_dict()
             elif action=="zone_del":
                 result=self.manager.drop(args['zonename'], req.GET.get('force', None))
             elif action=="zone_add":
@@ -128,12 +228,45 @@ class Controller(object):
                     "retry", "expire", "ttl"):
                     soa[p]=req.GET.get(p, None)
                 result=self.manager.add(args['zonename'], soa)
+            elif action=="zone_export":
+                zone=self.manager.get(args['zonename'])
+                soa=zone.get_soa()
+                streaming = True
+                res=webob.Response(app_iter=ClosingIter(self._export(
+                    zonefile.dump(args['zonename'], soa, zone.iter())),
+                    self.manager.release), content_type='text/dns')
+                res.headers["ETag"]=etag
+                return res
+            elif action=="zone_changes":
+                since=req.GET.get('since', None)
+                if since is None:
+                    raise Exception("since is required")
+                result=self._changes(args['zonename'], int(since),
+                    float(req.GET.get('wait', 0)))
+            elif action=="zone_import":
+                result=self._import(args['zonename'], req.body_file)
             elif action=="list":
                 name=req.GET.get('name', None)
                 name="" if name=='@' else name
                 type=req.GET.get('type', None)
-                records=self.manager.get(args['zonename']).get(name=name, type=type)
-                result=[r.__dict__ for r in records] 
+                zone=self.manager.get(args['zonename'])
+                if req.GET.get('limit', None):
+                    (limit, marker)=self._page_params(req)
+                    (records, marker)=zone.page(name=name, type=type,
+                        limit=limit, marker=marker)
+                    result={"records":[r.to_dict() for r in records],
+                        "marker":marker}
+                elif req.GET.get('stream', None):
+                    streaming = True
+                    res=webob.Response(app_iter=ClosingIter(
+                        self._stream(zone.iter(name=name, type=type)),
+                        self.manager.release),
+                        content_type='application/json')
+                    res.headers["ETag"]=etag
+                    return res
+                else:
+                    records=zone.get(name=name, type=type)
+                    result=[r.to_dict() for r in records] 
             elif action=="record_add":
                 rec=DNSRecord(
                     name="" if args['name']=='@' else args['name'],
@@ -153,13 +286,199 @@ class Controller(object):
                     ttl=req.GET.get('ttl', None),
                     priority=req.GET.get('priority', None)
                 )
+            elif action=="batch":
+                result={}
+                for zonename, items in json.loads(req.body).iteritems():
+                    result[zonename]=self._batch(req, zonename, items)
             else:
                 raise Exception("Incorrect action: "+action)
-            return webob.Response(json.dumps({"result":result, "error":None}),
-                content_type='application/json')
+            body=json.dumps({"result":result, "error":None})
+            if action=="index":
+                etag='"%s"' % hashlib.md5(body).hexdigest()
+                if self._not_modified(req, etag):
+                    return self._reply(None, etag, status=304)
+            if cache_key:
+                self.responses.set(cache_key, body, float("inf"))
+            return self._reply(body, etag)
         except Exception as e:
+            metrics.METRICS.inc("nova_dns_api_errors_total", action=action)
             return webob.Response(json.dumps({"result":None, "error":str(e)}),
                 content_type='application/json')
+        finally:
+            if not streaming:
+                self.manager.release()
+            metrics.METRICS.observe("nova_dns_api_request_seconds",
+                time.time()-start, action=action)
+            metrics.set_operation(prev_operation)
+
+    def _serial(self, zonename):
+        serial=SERIALS.get(zonename)
+        if serial is None:
+            serial=self.manager.get(zonename).get_serial()
+            SERIALS.set(zonename, serial)
+        return serial
+
+    @staticmethod
+    def _page_params(req):
+        """ (limit, marker) of records page, limit is positive and marker
+        (if any) is not negative integer """
+        limit=req.GET['limit']
+        if not limit.isdigit() or int(limit)<1:
+            raise Exception("Incorrect limit: " + limit.encode("utf-8"))
+        marker=req.GET.get('marker', None)
+        if marker and not marker.isdigit():
+            raise Exception("Incorrect marker: " + marker.encode("utf-8"))
+        return (int(limit), marker)
+
+    @staticmethod
+    def _not_modified(req, etag):
+        header=req.headers.get("If-None-Match", None)
+        if not header:
+            return False
+        tags=[t.strip() for t in header.split(",")]
+        return "*" in tags or etag in tags or "W/"+etag in tags
+
+    @staticmethod
+    def _reply(body, etag, status=200):
+        if status==304:
+            res=webob.Response(status=304)
+        else:
+            res=webob.Response(body, content_type='application/json')
+        if etag:
+            res.headers["ETag"]=etag
+        return res
+
+    def _stream(self, records):
+        """
+        yield JSON reply for ``records`` iterator by FLAGS.dns_page_size
+        records, so whole zone is never kept in memory
+        """
+        yield '{"result": ['
+        chunk=[]
+        sep=''
+        try:
+            for r in records:
+                chunk.append(json.dumps(r.to_dict()))
+                if len(chunk)>=FLAGS.dns_page_size:
+                    yield sep+", ".join(chunk)
+                    chunk=[]
+                    sep=', '
+            if chunk:
+                yield sep+", ".join(chunk)
+        except Exception:
+            #headers are already sent, so client gets broken JSON
+            LOG.exception("Failed to stream records")
+            return
+        yield '], "error": null}'
+
+    def _export(self, lines):
+        """
+        yield zone file by FLAGS.dns_page_size lines, see _stream
+        """
+        chunk=[]
+        try:
+            for line in lines:
+                chunk.append(line)
+                if len(chunk)>=FLAGS.dns_page_size:
+                    yield "".join(chunk).encode("utf-8")
+                    chunk=[]
+            if chunk:
+                yield "".join(chunk).encode("utf-8")
+        except Exception:
+            LOG.exception("Failed to export zone")
+            #unknown directive, so truncated file can't be loaded
+            yield "\n$ERROR export failed, zone file is incomplete\n"
+
+    def _changes(self, zonename, since, wait):
+        """
+        return changes of zone after serial ``since``, wait up to ``wait``
+        seconds if there are no changes yet. Changes made by this process
+        wake up waiting request at once, others are noticed by
+        FLAGS.dns_changes_poll_interval checks of serial
+        """
+        deadline=time.time()+min(wait, FLAGS.dns_changes_max_wait)
+        zone=self.manager.get(zonename)
+        while True:
+            (serial, changes)=zone.changes(since)
+            if changes!=[] or time.time()>=deadline:
+                break
+            #don't keep db connection while waiting
+            self.manager.release()
+            generation=SERIALS.generation(zonename)
+            until=min(deadline, time.time()+FLAGS.dns_changes_poll_interval)
+            while time.time()<until and \
+                    SERIALS.generation(zonename)==generation:
+                eventlet.sleep(0.1)
+        return {"serial":serial, "reset":changes is None,
+            "changes":changes or []}
+
+    def _import(self, zonename, body):
+        """
+        create zone from zone file ``body``, zone is dropped if any
+        record can't be loaded
+        """
+        records=zonefile.parse(iter(body.readline, ''), zonename)
+        soa=next(records, None)
+        if soa is None:
+            raise Exception("Empty zone file")
+        self.manager.add(zonename, dict((p, getattr(soa, p)) for p in
+            ("primary", "hostmaster", "serial", "refresh", "retry",
+            "expire", "ttl")))
+        try:
+            count=self.manager.get(zonename).load(records)
+        except Exception:
+            exc=sys.exc_info()
+            try:
+                self.manager.drop(zonename)
+            except Exception:
+                LOG.exception("[%s]: Failed to drop partially imported zone"
+                    % zonename)
+            raise exc[0], exc[1], exc[2]
+        LOG.info("[%s]: Zone was imported, %d records" % (zonename, count))
+        return "ok"
+
+    def _batch(self, req, zonename, items):
+        """
+        apply list of record operations from batch request to zone,
+        return list of {"result", "error"} - one for every operation
+        """
+        try:
+            if not AUTH.can(req, zonename)["write"]:
+                raise Exception('unauthorized')
+            zone=self.manager.get(zonename)
+            ops=[]
+            for item in items:
+                try:
+                    ops.append(self._batch_op(item))
+                except Exception as e:
+                    ops.append(e)
+            results=iter(zone.batch(
+                [op for op in ops if not isinstance(op, Exception)]))
+            ops=[op if isinstance(op, Exception) else results.next()
+                for op in ops]
+        except Exception as e:
+            ops=[e]*len(items)
+        return [{"result":None, "error":str(r)} if isinstance(r, Exception)
+            else {"result":r, "error":None} for r in ops]
+
+    def _batch_op(self, item):
+        action=item.get("action", None)
+        name=item.get("name", "")
+        name="" if name=='@' else name
+        if action=="add":
+            return ("add", DNSRecord(name=name, type=item["type"],
+                content=item["content"], ttl=item.get("ttl", None),
+                priority=item.get("priority", None)))
+        elif action=="edit":
+            type=DNSRecord.normtype(item["type"])
+            content=item.get("content", None)
+            if content:
+                DNSRecord.normcontent(type, content)
+            return ("edit", name, type, content,
+                item.get("priority", None), item.get("ttl", None))
+        elif action=="delete":
+            return ("delete", name, DNSRecord.normtype(item["type"]))
+        raise Exception("Incorrect action: "+str(action))
 
 class App(wsgi.Router):
     """
@@ -183,27 +502,55 @@ class App(wsgi.Router):
             if not - will refuse to delete if there are any sub-zone for
                 this zone
             return "ok" on success
-        GET /record/zonename[?name=&type=]
+        GET /record/zonename[?name=&type=&limit=&marker=&stream=]
             return JSON (array of objects). Will return 'err' if zone or
-                or (name, type) not exists
+                or (name, type) not exists. With limit return object with
+                "records" and "marker" of next page. With stream records
+                are sent as they are read from backend
         PUT /record/zonename/name/type/content[?ttl&priority]
             add record. return 'ok' on success. set name to '@' if empty
         POST /record/zonename/name/type?[params]
             return 'ok' on success, 'err' if zonename or (name, type) not exists
         DELETE /record/zonename/name/type
+        GET /zone/name/export
+            return zone file (RFC 1035) of zone, it is streamed
+        POST /zone/name/import
+            create zone from zone file in request body
+        GET /zone/name/changes?since=serial[&wait=seconds]
+            return record changes made after serial, wait for them up
+            to "wait" seconds
+        GET /metrics
+            return counters and timings in Prometheus text format
+        POST /record/
+            apply JSON body {"zonename": [{"action": "add"|"edit"|"delete",
+                "name", "type", "content", "ttl", "priority"}, ...], ...}
+            in one transaction per zone. Return results for every operation
         """
         #FIXME rewrite dict(controller=Controller(), action="...") to
         #controller=Controller
         #....controller=conntroller.index
         map = routes.Mapper()
+        map.connect(None, "/metrics",
+            controller=Controller(), action="metrics")
         map.connect(None, "/zone/",
             controller=Controller(), action="index")
+        map.connect(None, "/zone/{zonename}/export",
+            conditions=dict(method=["GET"]), controller=Controller(),
+            action="zone_export")
+        map.connect(None, "/zone/{zonename}/changes",
+            conditions=dict(method=["GET"]), controller=Controller(),
+            action="zone_changes")
+        map.connect(None, "/zone/{zonename}/import",
+            conditions=dict(method=["POST"]), controller=Controller(),
+            action="zone_import")
         map.connect(None, "/zone/{zonename}", conditions=dict(method=["GET"]),
             controller=Controller(), action="zone_get")
         map.connect(None, "/zone/{zonename}", conditions=dict(method=["PUT"]),
             controller=Controller(), action="zone_add")
         map.connect(None, "/zone/{zonename}", conditions=dict(method=["DELETE"]),
             controller=Controller(), action="zone_del")
+        map.connect(None, "/record/", conditions=dict(method=["POST"]),
+            controller=Controller(), action="batch")
         map.connect(None, "/record/{zonename}", conditions=dict(method=["GET"]),
             controller=Controller(), action="list")
         map.connect(None, "/record/{zonename}/{name}/{type}/{content}",
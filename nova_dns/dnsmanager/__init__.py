@@ -18,6 +18,8 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import re
+import socket
+import time
 
 from nova import flags
 from nova.openstack.common import cfg
@@ -40,7 +42,15 @@ opts = [
     cfg.IntOpt("dns_soa_retry", default=3600,
 			help="time between retries if the slave fails to contact the master"),
     cfg.IntOpt("dns_soa_expire", default=604800,
-			help="Indicates when the zone data is no longer authoritative")
+			help="Indicates when the zone data is no longer authoritative"),
+    cfg.IntOpt("dns_page_size", default=1000,
+			help="Number of records read at once when zone is iterated"),
+    cfg.IntOpt("dns_serial_cache_ttl", default=0,
+			help="Seconds to trust cached zone serial for conditional GET, "
+			"0 - read serial on every request"),
+    cfg.BoolOpt("dns_db_threadpool", default=False,
+			help="Run database queries in thread pool, so blocking driver "
+			"doesn't stop other requests")
 ]
 FLAGS.register_opts(opts)
 
@@ -49,6 +59,34 @@ record_types=set(('A', 'AAAA', 'MX', 'SOA', 'CNAME', 'PTR', 'SPF', 'SRV', 'TXT',
           'SSHFP'))
 
 
+class SerialCache(object):
+    """
+    Zone name => SOA serial, used as version of zone by REST replies.
+    Changes made by this process invalidate zone at once, changes made
+    by others are noticed after ``FLAGS.dns_serial_cache_ttl`` seconds.
+    """
+    def __init__(self):
+        self.serials={}
+        #zone name => number of local changes, wakes up waiting readers
+        self.changes={}
+    def get(self, zone_name):
+        v=self.serials.get(zone_name)
+        if v and v[1]>time.time():
+            return v[0]
+        return None
+    def set(self, zone_name, serial):
+        if FLAGS.dns_serial_cache_ttl:
+            self.serials[zone_name]=(serial,
+                time.time()+FLAGS.dns_serial_cache_ttl)
+    def invalidate(self, zone_name):
+        self.serials.pop(zone_name, None)
+        self.changes[zone_name]=self.changes.get(zone_name, 0)+1
+    def generation(self, zone_name):
+        return self.changes.get(zone_name, 0)
+
+SERIALS=SerialCache()
+
+
 class DNSManager:
     """abstract class"""
     __metaclass__ = ABCMeta
@@ -74,6 +112,19 @@ class DNSManager:
          """
         pass
 
+    def dump(self, types):
+        """ iterate (zone name, DNSRecord) over records of ``types`` in
+        all zones. Backends should override this to read all zones at once """
+        for zone_name in self.list():
+            for type in types:
+                for r in self.get(zone_name).get(type=type):
+                    yield (zone_name, r)
+
+    def release(self):
+        """ free resources (db session, etc) of current request.
+        Called at the end of every REST request and AMQP event """
+        pass
+
 
 
 class DNSZone:
@@ -92,17 +143,146 @@ class DNSZone:
     @abstractmethod
     def set(self, name, type, content, priority, ttl):
         pass
+    def get_serial(self):
+        """ SOA serial - version of zone, it grows on every change """
+        return self.get_soa().serial
     @abstractmethod
     def delete(self, name, type):
         pass
+    def page(self, name=None, type=None, limit=None, marker=None):
+        """ return (records, marker) - up to ``limit`` records after
+        ``marker`` and marker of next page (None for last page).
+        Backends should override this to avoid reading whole zone """
+        records=self.get(name=name, type=type)
+        start=int(marker) if marker else 0
+        end=start+int(limit) if limit else len(records)
+        return (records[start:end], str(end) if end<len(records) else None)
+    def find(self, type, content):
+        """ return records of ``type`` with ``content``. Backends should
+        override this to avoid reading all records of type """
+        return [r for r in self.get(type=type) if r.content==content]
+    def iter(self, name=None, type=None):
+        """ iterate over records reading FLAGS.dns_page_size records
+        at once """
+        marker=None
+        while True:
+            (records, marker)=self.page(name=name, type=type,
+                limit=FLAGS.dns_page_size, marker=marker)
+            for r in records:
+                yield r
+            if marker is None:
+                return
+    def add_many(self, records):
+        """ add list of DNSRecord. Backends should override this to write
+        all records at once and update SOA serial only one time """
+        for v in records:
+            self.add(v)
+        return "ok"
+    def load(self, records):
+        """ add DNSRecord from iterator ``records`` (e.g. parsed zone
+        file) by FLAGS.dns_page_size chunks, return number of records.
+        Backends should override this to load all records in one
+        transaction with single SOA serial update """
+        count=0
+        chunk=[]
+        for v in records:
+            chunk.append(v)
+            if len(chunk)>=FLAGS.dns_page_size:
+                self.add_many(chunk)
+                count+=len(chunk)
+                chunk=[]
+        if chunk:
+            self.add_many(chunk)
+            count+=len(chunk)
+        return count
+    def changes(self, since):
+        """ return (serial, changes) - current serial of zone and list of
+        {"action": "add"|"delete", "serial", "record"} made after serial
+        ``since``, in order. Edit is "delete" of old record and "add" of
+        new one. changes is None if they are unknown (too old serial,
+        zone was recreated) and whole zone has to be read """
+        raise Exception("Changes journal is not supported by backend")
+    def delete_many(self, records):
+        """ delete list of (name, type) records, see add_many """
+        for name, type in records:
+            self.delete(name, type)
+        return "ok"
+    def batch(self, ops):
+        """ apply list of operations:
+            ("add", DNSRecord)
+            ("edit", name, type, content, priority, ttl)
+            ("delete", name, type)
+        return list of results, one per operation. Failed operation gives
+        exception object instead of result and doesn't stop others.
+        Backends should override this to apply all operations in one
+        transaction with single SOA serial update """
+        res=[]
+        for op in ops:
+            try:
+                if op[0]=="add":
+                    res.append(self.add(op[1]))
+                elif op[0]=="edit":
+                    res.append(self.set(*op[1:]))
+                elif op[0]=="delete":
+                    res.append(self.delete(*op[1:]))
+                else:
+                    raise Exception("Incorrect action: " + str(op[0]))
+            except Exception as e:
+                res.append(e)
+        return res
+
+NAME_RE=re.compile(r'\A(?:[\w\d-]+\.)*(?:[\w\d-]+)\Z')
+#domain name in content, may be absolute
+TARGET_RE=re.compile(r'\A(?:[\w\d-]+\.)*(?:[\w\d-]+)\.?\Z')
+IPV4_RE=re.compile(r'\A(?:(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\.){3}'
+    r'(?:25[0-5]|2[0-4]\d|1\d\d|[1-9]?\d)\Z')
+SRV_RE=re.compile(r'\A\d+ \d+ (\S+)\Z')
+
+def _ipv6(content):
+    try:
+        socket.inet_pton(socket.AF_INET6, content)
+        return True
+    except (socket.error, ValueError):
+        return False
 
-class DNSRecord:
+#type => function checking record content
+content_validators={
+    'A': lambda c: IPV4_RE.match(c) is not None,
+    'AAAA': _ipv6,
+    'CNAME': lambda c: TARGET_RE.match(c) is not None,
+    'PTR': lambda c: TARGET_RE.match(c) is not None,
+    'NS': lambda c: TARGET_RE.match(c) is not None,
+    'MX': lambda c: TARGET_RE.match(c) is not None,
+    #"weight port target", priority is separate field
+    'SRV': lambda c: SRV_RE.match(c) is not None and
+        TARGET_RE.match(SRV_RE.match(c).group(1)) is not None,
+}
+
+class DNSRecord(object):
+    """
+    Record with validated name, type and content. Records read from
+    backend are created by from_db() without checks.
+    """
+    __slots__=('name', 'type', 'content', 'priority', 'ttl')
     def __init__(self, name, type, content, priority=None, ttl=None):
         self.name=DNSRecord.normname(name)
         self.type=DNSRecord.normtype(type)
-        self.content=content
+        self.content=DNSRecord.normcontent(self.type, content)
         self.priority=int(priority) if priority else 0
         self.ttl=int(ttl) if ttl else FLAGS.dns_default_ttl
+    @classmethod
+    def from_db(cls, name, type, content, priority, ttl):
+        """ record stored by backend, it was validated when added """
+        r=cls.__new__(cls)
+        r.name=name
+        r.type=type
+        r.content=content
+        r.priority=priority or 0
+        r.ttl=ttl if ttl else FLAGS.dns_default_ttl
+        return r
+    def to_dict(self):
+        return {"name":self.name, "type":self.type, "content":self.content,
+            "priority":self.priority, "ttl":self.ttl}
     @staticmethod
     def normtype(type):
         t=str(type).upper()
@@ -112,12 +292,29 @@ class DNSRecord:
     @staticmethod
     def normname(n):
         name = str(n).lower()
-        if name=="" or name=="*" or re.match(r'\A(?:[\w\d-]+\.)*(?:[\w\d-]+)\Z', name):
+        if name=="" or name=="*" or NAME_RE.match(name):
             return name
         else:
             raise ValueError("Incorrect DNS name: " + name)
+    @staticmethod
+    def normcontent(type, content):
+        validator=content_validators.get(type)
+        if not validator:
+            return content
+        try:
+            valid=validator(str(content))
+        except UnicodeError:
+            #non-ascii content of validated type
+            valid=False
+        if not valid:
+            raise ValueError("Incorrect %s record content: %s" % (type,
+                content.encode("utf-8") if isinstance(content, unicode)
+                else content))
+        return content
 
 class DNSSOARecord(DNSRecord):
+    __slots__=('primary', 'hostmaster', 'serial', 'refresh', 'retry',
+        'expire')
     def __init__(self, primary=None, hostmaster=None, serial=None, refresh=None, retry=None, expire=None, ttl=None):
         self.primary=primary if primary else FLAGS.dns_soa_primary
         self.hostmaster=hostmaster if hostmaster else FLAGS.dns_soa_email
@@ -126,4 +323,10 @@ class DNSSOARecord(DNSRecord):
         self.retry=int(retry) if retry else FLAGS.dns_soa_retry
         self.expire=int(expire) if expire else FLAGS.dns_soa_expire
         DNSRecord.__init__(self, '', 'SOA', '', None, ttl)
+    def to_dict(self):
+        d=DNSRecord.to_dict(self)
+        d.update(primary=self.primary, hostmaster=self.hostmaster,
+            serial=self.serial, refresh=self.refresh, retry=self.retry,
+            expire=self.expire)
+        return d
 
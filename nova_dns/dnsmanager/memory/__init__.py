@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+In-memory backend with the same semantics as PowerDNS one (fqdn record
+names, SOA serial update on every change). Zones live in module-level
+ZONES and are shared by all managers of the process, nothing is saved.
+For tests and for measuring API/listener overhead without database.
+"""
+
+import time
+
+from nova import log as logging
+from nova_dns.dnsmanager import DNSManager, DNSZone, DNSRecord, DNSSOARecord
+from nova_dns.dnsmanager import SERIALS
+
+LOG = logging.getLogger("nova_dns.dnsmanager.memory")
+
+#zone name => {fqdn: {type: [[content, priority, ttl, change_date]]}}
+ZONES={}
+
+
+class Manager(DNSManager):
+    def init_host(self):
+        #make nova 'service' happy
+        pass
+    def list(self):
+        return ZONES.keys()
+    def add(self, zone_name, soa={}):
+        zone_name=DNSRecord.normname(zone_name)
+        if zone_name in ZONES:
+            raise Exception('Zone already exists')
+        ZONES[zone_name]={}
+        LOG.info("[%s]: Zone was added" % (zone_name))
+        soa=DNSSOARecord(**soa)
+        soa.content=" ".join((str(f) for f in (soa.primary, soa.hostmaster,
+            soa.serial, soa.refresh, soa.retry, soa.expire, soa.ttl)))
+        MemoryZone(zone_name).add(soa)
+        return "ok"
+    def drop(self, zone_name, force=False):
+        zones=[z for z in ZONES if z==zone_name or z.endswith('.'+zone_name)]
+        if not zones:
+            raise Exception('Zone not exists')
+        elif len(zones)>1 and not force:
+            raise Exception("Subzones exists: " + " ".join(zones))
+        for z in zones:
+            del ZONES[z]
+            SERIALS.invalidate(z)
+            LOG.info("[%s]: Zone was deleted" % (z))
+        return "ok"
+    def get(self, zone_name):
+        if zone_name not in ZONES:
+            raise Exception('Zone does not exist')
+        return MemoryZone(zone_name)
+    def dump(self, types):
+        for (zone_name, names) in ZONES.items():
+            for (name, rrsets) in names.items():
+                for type in types:
+                    for v in rrsets.get(type, ()):
+                        yield (zone_name, MemoryZone._record(name, type, v))
+
+
+class MemoryZone(DNSZone):
+    def __init__(self, zone_name):
+        if zone_name not in ZONES:
+            raise Exception("Unknown zone: "+zone_name)
+        self.zone_name=zone_name
+        self.names=ZONES[zone_name]
+    def get_soa(self):
+        return DNSSOARecord(*self.names[self.zone_name]['SOA'][0][0].split())
+    def drop(self):
+        self.names.clear()
+    def add(self, v):
+        change_date=int(time.time())
+        self._add(v, change_date)
+        LOG.info("[%s]: Record (%s, %s, '%s') was added" %
+            (self.zone_name, v.name, v.type, v.content))
+        self._update_serial(change_date)
+        return "ok"
+    def add_many(self, records):
+        change_date=int(time.time())
+        #validate all first - all or nothing like one transaction
+        keys=set()
+        for v in records:
+            key=self._key(v.name, v.type)
+            if key in keys or self._exists(key):
+                raise Exception("Record (%s, %s) already exists" % key)
+            keys.add(key)
+        for v in records:
+            self._add(v, change_date)
+        self._update_serial(change_date)
+        LOG.info("[%s]: %d records were added" %
+            (self.zone_name, len(records)))
+        return "ok"
+    def get(self, name=None, type=None):
+        if type:
+            type=DNSRecord.normtype(type)
+        if name is None:
+            names=self.names.iteritems()
+        else:
+            fqdn=self._fqdn(name)
+            names=[(fqdn, self.names.get(fqdn, {}))]
+        res=[]
+        for (fqdn, rrsets) in names:
+            for (t, rrset) in rrsets.iteritems():
+                if not type or t==type:
+                    res.extend(self._record(fqdn, t, v) for v in rrset)
+        return res
+    def set(self, name, type, content="", priority="", ttl=""):
+        change_date=int(time.time())
+        self._set(name, type, content, priority, ttl, change_date)
+        self._update_serial(change_date)
+        LOG.info("[%s]: Record (%s, %s) was changed" %
+            (self.zone_name, name, type))
+        return "ok"
+    def batch(self, ops):
+        if not ops:
+            return []
+        change_date=int(time.time())
+        res=[]
+        for op in ops:
+            try:
+                if op[0]=="add":
+                    self._add(op[1], change_date)
+                elif op[0]=="edit":
+                    self._set(*(op[1:]+(change_date,)))
+                elif op[0]=="delete":
+                    if not self._delete(op[1], op[2]):
+                        raise Exception("No records was deleted")
+                else:
+                    raise Exception("Incorrect action: " + str(op[0]))
+                res.append("ok")
+            except Exception as e:
+                res.append(e)
+        done=len([r for r in res if r=="ok"])
+        if done:
+            self._update_serial(change_date)
+        LOG.info("[%s]: %d of %d batch operations were applied" %
+            (self.zone_name, done, len(ops)))
+        return res
+    def delete(self, name, type=None):
+        if self._delete(name, type):
+            LOG.info("[%s]: Record (%s, %s) was deleted" %
+                (self.zone_name, name, type))
+            self._update_serial(int(time.time()))
+            return "ok"
+        else:
+            raise Exception("No records was deleted")
+    def delete_many(self, records):
+        deleted=0
+        for name, type in records:
+            deleted+=self._delete(name, type)
+        if deleted:
+            self._update_serial(int(time.time()))
+        LOG.info("[%s]: %d records were deleted" % (self.zone_name, deleted))
+        return "ok"
+    def _add(self, v, change_date):
+        #one record of name and type, like unique index of PowerDNS table
+        key=self._key(v.name, v.type)
+        if self._exists(key):
+            raise Exception("Record (%s, %s) already exists" % key)
+        self.names.setdefault(key[0], {})[key[1]]=[
+            [v.content, v.priority, v.ttl, change_date]]
+    def _set(self, name, type, content, priority, ttl, change_date):
+        type=DNSRecord.normtype(type)
+        if type=='SOA':
+            raise Exception("Can't change SOA")
+        if content:
+            DNSRecord.normcontent(type, content)
+        rrset=self.names.get(self._fqdn(name), {}).get(type)
+        if not rrset:
+            raise Exception("Not found record (%s, %s)" % (name, type))
+        v=rrset[0]
+        if content:
+            v[0]=content
+        if priority:
+            v[1]=int(priority)
+        if ttl:
+            v[2]=int(ttl)
+        v[3]=change_date
+    def _delete(self, name, type=None):
+        """return number of deleted records"""
+        fqdn=self._fqdn(name)
+        rrsets=self.names.get(fqdn)
+        if not rrsets:
+            return 0
+        if type:
+            deleted=len(rrsets.pop(DNSRecord.normtype(type), ()))
+        else:
+            deleted=sum(len(rrset) for rrset in rrsets.itervalues())
+            rrsets.clear()
+        if not rrsets:
+            del self.names[fqdn]
+        return deleted
+    def _exists(self, key):
+        return bool(self.names.get(key[0], {}).get(key[1]))
+    def _update_serial(self, change_date):
+        v=self.names[self.zone_name]['SOA'][0]
+        content=v[0].split()
+        content[2]=str(max(change_date, int(content[2])+1))
+        v[0]=" ".join(content)
+        v[3]=change_date
+        SERIALS.invalidate(self.zone_name)
+    @staticmethod
+    def _record(fqdn, type, v):
+        if type=='SOA':
+            return DNSSOARecord(*v[0].split())
+        return DNSRecord.from_db(fqdn, type, v[0], v[1], v[2])
+    def _fqdn(self, name):
+        return name+"."+self.zone_name if name else self.zone_name
+    def _key(self, name, type):
+        return (DNSRecord.normname(self._fqdn(name)), DNSRecord.normtype(type))
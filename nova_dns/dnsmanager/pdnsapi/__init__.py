@@ -0,0 +1,392 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+PowerDNS HTTP API backend. Record changes are sent as RRset PATCH, one
+request per batch, over pooled keep-alive connections.
+"""
+
+import httplib
+import json
+import socket
+import urllib
+import urlparse
+
+from nova import flags
+from nova.openstack.common import cfg
+from nova import log as logging
+from nova_dns.dnsmanager import DNSManager, DNSZone, DNSRecord, DNSSOARecord
+from nova_dns.dnsmanager import SERIALS
+
+LOG = logging.getLogger("nova_dns.dnsmanager.pdnsapi")
+FLAGS = flags.FLAGS
+
+opts = [
+    cfg.StrOpt("dns_api_url", default="http://127.0.0.1:8081",
+			help="PowerDNS API url"),
+    cfg.StrOpt("dns_api_key", default="",
+			help="PowerDNS API key (X-API-Key header)"),
+    cfg.StrOpt("dns_api_server", default="localhost",
+			help="PowerDNS server id"),
+    cfg.IntOpt("dns_api_pool_size", default=5,
+			help="Max number of idle keep-alive connections to API"),
+    cfg.IntOpt("dns_api_timeout", default=30,
+			help="Seconds to wait for API reply")
+]
+FLAGS.register_opts(opts)
+
+#types with domain name in content - API wants them absolute (with dot)
+name_types=set(('CNAME', 'NS', 'PTR', 'MX', 'SRV'))
+#types with priority in content
+prio_types=set(('MX', 'SRV'))
+
+
+class APIError(Exception):
+    def __init__(self, status, message):
+        Exception.__init__(self, "PowerDNS API error %s: %s" %
+            (status, message))
+        self.status=status
+
+
+class ConnectionPool(object):
+    """
+    Idle keep-alive connections to one host. Connection is taken for
+    one request and put back after its reply was read.
+    """
+    def __init__(self, url, size, timeout):
+        parts=urlparse.urlsplit(url)
+        self.cls=(httplib.HTTPSConnection if parts.scheme=="https" else
+            httplib.HTTPConnection)
+        self.netloc=parts.netloc
+        self.prefix=parts.path.rstrip('/')
+        self.size=size
+        self.timeout=timeout
+        self.idle=[]
+        #number of created connections, for tests and stats
+        self.created=0
+
+    def request(self, method, path, body=None, headers={}):
+        """return (status, reply body). Request on stale idle connection
+        is retried once on a new one"""
+        for attempt in (0, 1):
+            reused=bool(self.idle)
+            conn=self.idle.pop() if reused else self._connect()
+            try:
+                conn.request(method, self.prefix+path, body, headers)
+                resp=conn.getresponse()
+                data=resp.read()
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                if reused and not attempt:
+                    continue
+                raise
+            if resp.will_close or len(self.idle)>=self.size:
+                conn.close()
+            else:
+                self.idle.append(conn)
+            return (resp.status, data)
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+    def _connect(self):
+        self.created+=1
+        return self.cls(self.netloc, timeout=self.timeout)
+
+_POOL=None
+
+def get_pool():
+    global _POOL
+    if _POOL is None:
+        _POOL=ConnectionPool(FLAGS.dns_api_url, FLAGS.dns_api_pool_size,
+            FLAGS.dns_api_timeout)
+    return _POOL
+
+
+def call(method, path, data=None):
+    """API request, return decoded json reply (None for empty one)"""
+    headers={"X-API-Key": FLAGS.dns_api_key, "Accept": "application/json"}
+    body=None
+    if data is not None:
+        body=json.dumps(data)
+        headers["Content-Type"]="application/json"
+    (status, reply)=get_pool().request(method,
+        "/api/v1/servers/%s%s" % (urllib.quote(FLAGS.dns_api_server), path),
+        body, headers)
+    if status>=300:
+        try:
+            message=json.loads(reply)["error"]
+        except (ValueError, KeyError, TypeError):
+            message=reply
+        raise APIError(status, message)
+    return json.loads(reply) if reply else None
+
+
+def absname(name):
+    return name if name.endswith('.') else name+'.'
+
+
+def zone_path(zone_name):
+    return "/zones/"+urllib.quote(absname(zone_name), safe='')
+
+
+class Manager(DNSManager):
+    def init_host(self):
+        #make nova 'service' happy
+        pass
+    def list(self):
+        return [z["name"].rstrip('.') for z in call("GET", "/zones")]
+    def add(self, zone_name, soa={}):
+        zone_name=DNSRecord.normname(zone_name)
+        soa=DNSSOARecord(**soa)
+        content=" ".join((str(f) for f in (absname(soa.primary),
+            absname(soa.hostmaster), soa.serial, soa.refresh, soa.retry,
+            soa.expire, soa.ttl)))
+        try:
+            call("POST", "/zones", {"name": absname(zone_name),
+                "kind": "Native", "nameservers": [],
+                "rrsets": [{"name": absname(zone_name), "type": "SOA",
+                "ttl": soa.ttl,
+                "records": [{"content": content, "disabled": False}]}]})
+        except APIError as e:
+            #409 Conflict, older PowerDNS gives 422
+            if e.status==409 or (e.status==422 and "exists" in str(e)):
+                raise Exception('Zone already exists')
+            raise
+        LOG.info("[%s]: Zone was added" % (zone_name))
+        return "ok"
+    def drop(self, zone_name, force=False):
+        zones=[z for z in self.list()
+            if z==zone_name or z.endswith('.'+zone_name)]
+        if not zones:
+            raise Exception('Zone not exists')
+        elif len(zones)>1 and not force:
+            raise Exception("Subzones exists: " + " ".join(zones))
+        for name in zones:
+            call("DELETE", zone_path(name))
+            SERIALS.invalidate(name)
+            LOG.info("[%s]: Zone was deleted" % (name))
+        return "ok"
+    def get(self, zone_name):
+        try:
+            call("GET", zone_path(zone_name)+"?rrsets=false")
+        except APIError as e:
+            if e.status in (404, 422):
+                raise Exception('Zone does not exist')
+            raise
+        return PowerDNSAPIZone(zone_name)
+    def dump(self, types):
+        types=set(types)
+        for zone_name in self.list():
+            for r in PowerDNSAPIZone(zone_name).records():
+                if r.type in types:
+                    yield (zone_name, r)
+    def release(self):
+        pass
+
+
+class PowerDNSAPIZone(DNSZone):
+    def __init__(self, zone_name):
+        self.zone_name=zone_name
+        self.path=zone_path(zone_name)
+    def get_soa(self):
+        for r in self.rrsets(self.zone_name, "SOA"):
+            return self._record(r)[0]
+        raise Exception("Zone has no SOA: "+self.zone_name)
+    def get_serial(self):
+        return str(call("GET", self.path+"?rrsets=false")["serial"])
+    def drop(self):
+        self.patch([{"name": r["name"], "type": r["type"],
+            "changetype": "DELETE"} for r in self.rrsets()
+            if r["type"]!="SOA"])
+    def add(self, v):
+        #like SQL backend (unique name, type index), existing name and
+        #type can't be added again
+        return self._check(self.batch([("add", v)]))
+    def add_many(self, records):
+        for r in self.batch([("add", v) for v in records]):
+            if isinstance(r, Exception):
+                raise r
+        return "ok"
+    def get(self, name=None, type=None):
+        if name is not None:
+            name=self._fqdn(name)
+        if type:
+            type=DNSRecord.normtype(type)
+        return [r for r in self.records() if (name is None or r.name==name)
+            and (not type or r.type==type)]
+    def find(self, type, content):
+        #search-data matches names and contents in all zones
+        type=DNSRecord.normtype(type)
+        res=[]
+        for r in call("GET", "/search-data?"+urllib.urlencode({"q": content,
+                "max": FLAGS.dns_page_size, "object_type": "record"})):
+            if r.get("object_type")!="record" or \
+                    r["zone"]!=absname(self.zone_name) or r["type"]!=type:
+                continue
+            res.extend(v for v in self._record({"name": r["name"],
+                "type": type, "ttl": r.get("ttl"),
+                "records": [{"content": r["content"]}]}) if v.content==content)
+        return res
+    def set(self, name, type, content="", priority="", ttl=""):
+        return self._check(self.batch([("edit", name, type, content,
+            priority, ttl)]))
+    def delete(self, name, type=None):
+        if type:
+            return self._check(self.batch([("delete", name, type)]))
+        rrsets=self.rrsets(DNSRecord.normname(self._fqdn(name)))
+        if not rrsets:
+            raise Exception("No records was deleted")
+        self.patch([{"name": r["name"], "type": r["type"],
+            "changetype": "DELETE"} for r in rrsets])
+        return "ok"
+    def delete_many(self, records):
+        self.batch([("delete", name, type) for (name, type) in records])
+        return "ok"
+    def batch(self, ops):
+        """ops are applied to current rrsets of zone, changed rrsets are
+        sent by one PATCH. If all ops are about one rrset, only it is read"""
+        if not ops:
+            return []
+        keys=set()
+        for op in ops:
+            try:
+                keys.add(self._key(op[1].name, op[1].type) if op[0]=="add"
+                    else self._key(op[1], op[2]))
+            except (ValueError, IndexError, AttributeError):
+                #will be reported by operation itself
+                pass
+        if len(keys)==1:
+            rrsets=self.rrsets(*list(keys)[0])
+        else:
+            rrsets=self.rrsets()
+        rrsets=dict(((r["name"], r["type"]), r) for r in rrsets)
+        changed={}
+        res=[]
+        for op in ops:
+            try:
+                if op[0]=="add":
+                    v=op[1]
+                    key=self._key(v.name, v.type)
+                    if key in rrsets:
+                        raise Exception("Record (%s, %s) already exists" %
+                            (key[0].rstrip('.'), key[1]))
+                    rrsets[key]={"name": key[0], "type": key[1], "ttl": v.ttl,
+                        "records": [{"content": self._content(v.type,
+                            v.content, v.priority), "disabled": False}]}
+                elif op[0]=="edit":
+                    (name, type, content, priority, ttl)=op[1:]
+                    key=self._key(name, type)
+                    if key[1]=='SOA':
+                        raise Exception("Can't change SOA")
+                    if content:
+                        DNSRecord.normcontent(key[1], content)
+                    if key not in rrsets:
+                        raise Exception("Not found record (%s, %s)" %
+                            (name, type))
+                    r=self._record(rrsets[key])[0]
+                    rrsets[key]=dict(rrsets[key], ttl=int(ttl or r.ttl),
+                        records=[{"content": self._content(r.type,
+                            content or r.content, priority or r.priority),
+                            "disabled": False}])
+                elif op[0]=="delete":
+                    key=self._key(op[1], op[2])
+                    if key not in rrsets:
+                        raise Exception("No records was deleted")
+                    del rrsets[key]
+                else:
+                    raise Exception("Incorrect action: " + str(op[0]))
+                changed[key]=rrsets.get(key)
+                res.append("ok")
+            except Exception as e:
+                res.append(e)
+        patch=[]
+        for (key, r) in changed.iteritems():
+            if r is None:
+                patch.append({"name": key[0], "type": key[1],
+                    "changetype": "DELETE"})
+            else:
+                patch.append(dict(r, changetype="REPLACE"))
+        if patch:
+            self.patch(patch)
+        LOG.info("[%s]: %d of %d batch operations were applied" %
+            (self.zone_name, len(res)-len([r for r in res
+                if isinstance(r, Exception)]), len(ops)))
+        return res
+    def rrsets(self, name=None, type=None):
+        """rrsets of zone, only ones with ``name`` (and ``type``) if set.
+        PowerDNS 4.8+ filters them itself"""
+        if name is None:
+            return call("GET", self.path)["rrsets"]
+        name=absname(name)
+        params={"rrset_name": name}
+        if type:
+            type=DNSRecord.normtype(type)
+            params["rrset_type"]=type
+        return [r for r in call("GET", self.path+"?"+urllib.urlencode(
+            params))["rrsets"] if r["name"]==name and (not type or
+            r["type"]==type)]
+    def records(self):
+        res=[]
+        for r in self.rrsets():
+            res.extend(self._record(r))
+        return res
+    def patch(self, rrsets):
+        """one PATCH request, PowerDNS updates serial itself"""
+        if rrsets:
+            call("PATCH", self.path, {"rrsets": rrsets})
+            SERIALS.invalidate(self.zone_name)
+    @staticmethod
+    def _record(r):
+        """DNSRecord list for rrset"""
+        name=r["name"].rstrip('.')
+        res=[]
+        for rec in r["records"]:
+            content=rec["content"]
+            if r["type"]=='SOA':
+                #primary and hostmaster are absolute in API
+                content=content.split()
+                res.append(DNSSOARecord(*([n.rstrip('.')
+                    for n in content[:2]]+content[2:])))
+                continue
+            priority=None
+            if r["type"] in prio_types:
+                (priority, content)=content.split(None, 1)
+            if r["type"] in name_types and content.endswith('.'):
+                content=content[:-1]
+            res.append(DNSRecord.from_db(name, r["type"], content,
+                int(priority) if priority else 0, r.get("ttl")))
+        return res
+    @staticmethod
+    def _content(type, content, priority):
+        if type in name_types:
+            content=absname(content)
+        if type in prio_types:
+            content="%d %s" % (int(priority or 0), content)
+        return content
+    def _fqdn(self, name):
+        return name+"."+self.zone_name if name else self.zone_name
+    def _key(self, name, type):
+        return (absname(DNSRecord.normname(self._fqdn(name))),
+            DNSRecord.normtype(type))
+    def _check(self, res):
+        if isinstance(res[0], Exception):
+            raise res[0]
+        return res[0]
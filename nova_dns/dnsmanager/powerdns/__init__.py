@@ -17,18 +17,63 @@
 #    You should have received a copy of the GNU General Public License
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import contextlib
 import time
 
 from nova import flags
+from nova.openstack.common import cfg
 from nova import log as logging
 from nova_dns.dnsmanager import DNSManager, DNSZone, DNSRecord, DNSSOARecord
-from nova_dns.dnsmanager.powerdns.session import get_session
-from nova_dns.dnsmanager.powerdns.models import Domains, Records
-from sqlalchemy.sql import and_
+from nova_dns.dnsmanager import SERIALS
+from nova_dns.dnsmanager.powerdns.session import get_session, remove_session
+from nova_dns.dnsmanager.powerdns.models import Domains, Records, DomainLabels
+from nova_dns.dnsmanager.powerdns.models import RecordChanges
+from sqlalchemy.sql import and_, func
 LOG = logging.getLogger("nova_dns.dnsmanager.powerdns")
+FLAGS = flags.FLAGS
+
+opts = [
+    cfg.IntOpt("dns_zone_cache_ttl", default=60,
+			help="Seconds to cache zone name => domain id mapping"),
+    cfg.IntOpt("dns_journal_ttl", default=86400,
+			help="Seconds to keep record changes journal, 0 - no journal")
+]
+FLAGS.register_opts(opts)
 
 models.register_models()
 
+class DomainCache(object):
+    """
+    Zone name => domain id index shared by all managers of the process.
+    Entries expire after ``FLAGS.dns_zone_cache_ttl`` seconds, so zones
+    dropped by other processes are noticed.
+    """
+    def __init__(self):
+        self.domains={}
+    def get(self, zone_name):
+        v=self.domains.get(zone_name)
+        if v and v[1]>time.time():
+            return v[0]
+        return None
+    def set(self, zone_name, domain_id):
+        self.domains[zone_name]=(domain_id,
+            time.time()+FLAGS.dns_zone_cache_ttl)
+    def invalidate(self, zone_name):
+        self.domains.pop(zone_name, None)
+
+DOMAINS=DomainCache()
+
+#domain id => time of last journal trim
+TRIMMED={}
+#time of last labelling of zones added by other tools, done on start by
+#models.register_models()
+INDEXED=[time.time()]
+#seconds between journal trims of one zone
+TRIM_INTERVAL=60
+#max number of names in one "in" lookup, below bound parameters limit of
+#databases (999 in SQLite)
+IN_CHUNK=500
+
 class Manager(DNSManager):
     def __init__(self):
         self.session=get_session()
@@ -36,47 +81,108 @@ class Manager(DNSManager):
         #make nova 'service' happy
         pass
     def list(self):
-        return [name[0] for name in self.session.query(Domains.name).all()]
+        res=[]
+        for name, domain_id in self.session.query(Domains.name, Domains.id).all():
+            DOMAINS.set(name, domain_id)
+            res.append(name)
+        return res
     def add(self, zone_name, soa={}):
-        if zone_name in self.list():
+        if self._domain_id(zone_name) is not None:
             raise Exception('Zone already exists')
         zone_name=DNSRecord.normname(zone_name)
-        self.session.add(Domains(name=zone_name, type="NATIVE"))
+        domain=Domains(name=zone_name, type="NATIVE")
+        self.session.add(domain)
         self.session.flush()
+        rname=DomainLabels.reverse(zone_name)
+        #label of zone which was dropped outside of nova-dns
+        self.session.query(DomainLabels).filter(
+            DomainLabels.rname==rname).delete(synchronize_session=False)
+        self.session.add(DomainLabels(domain_id=domain.id, rname=rname))
+        self.session.flush()
+        DOMAINS.set(zone_name, domain.id)
         LOG.info("[%s]: Zone was added" % (zone_name))
         soa=DNSSOARecord(**soa)
         # PowerDNS-specific. TODO make this more pytonish - with objects
         # and bells
         soa.content=" ".join((str(f) for f in (soa.primary, soa.hostmaster, soa.serial,
             soa.refresh, soa.retry, soa.expire, soa.ttl)))
-        PowerDNSZone(zone_name).add(soa)
+        zone=PowerDNSZone(zone_name, domain.id)
+        #nothing is known about changes before zone creation
+        zone.reset=True
+        zone.add(soa)
         return "ok"
     def drop(self, zone_name, force=False):
-        domains=self.session.query(Domains).filter(Domains.name.like('%'+zone_name)).all()
+        domains=self._subtree(zone_name)
+        if not domains and self.session.query(Domains.id).filter(
+                Domains.name==zone_name).first():
+            #zone was added by other tool and isn't indexed yet
+            self._index(force=True)
+            domains=self._subtree(zone_name)
         if not domains:
             raise Exception('Zone not exists')
         elif len(domains)>1 and not force:
             raise Exception("Subzones exists: " + " ".join([d.name for d in domains]))
+        ids=[d.id for d in domains]
+        with self.session.begin():
+            for model, column in ((Records, Records.domain_id),
+                    (RecordChanges, RecordChanges.domain_id),
+                    (DomainLabels, DomainLabels.domain_id),
+                    (Domains, Domains.id)):
+                self.session.query(model).filter(column.in_(ids)).delete(
+                    synchronize_session=False)
         for domain in domains:
-            PowerDNSZone(domain.name).drop()
-            self.session.delete(domain)
+            DOMAINS.invalidate(domain.name)
+            SERIALS.invalidate(domain.name)
             LOG.info("[%s]: Zone was deleted" % (domain.name))
-        self.session.flush()
         return "ok"
     def get(self, zone_name):
-        if zone_name in self.list():
-            return PowerDNSZone(zone_name)
-        else:
+        domain_id=self._domain_id(zone_name)
+        if domain_id is None:
             raise Exception('Zone does not exist')
+        return PowerDNSZone(zone_name, domain_id)
+    def dump(self, types):
+        q=self.session.query(Domains.name, Records).filter(
+            Domains.id==Records.domain_id).filter(Records.type.in_(types))
+        for (zone_name, r) in q.yield_per(FLAGS.dns_page_size):
+            yield (zone_name, PowerDNSZone._record(r))
+    def release(self):
+        remove_session()
+    def _subtree(self, zone_name):
+        """ (id, name) of zone and its subzones, range of labels index """
+        self._index()
+        return DomainLabels.subtree(self.session.query(Domains.id,
+            Domains.name).filter(Domains.id==DomainLabels.domain_id),
+            zone_name).all()
+    def _index(self, force=False):
+        """ label zones added by other tools, whole domains table is read
+        at most once per FLAGS.dns_zone_cache_ttl """
+        now=time.time()
+        if force or INDEXED[0]+FLAGS.dns_zone_cache_ttl<now:
+            INDEXED[0]=now
+            models.index_domains(self.session)
+    def _domain_id(self, zone_name):
+        domain_id=DOMAINS.get(zone_name)
+        if domain_id is None:
+            domain=self.session.query(Domains.id).filter(
+                Domains.name==zone_name).first()
+            if domain:
+                domain_id=domain.id
+                DOMAINS.set(zone_name, domain_id)
+        return domain_id
 
 class PowerDNSZone(DNSZone):
-    def __init__(self, zone_name):
+    def __init__(self, zone_name, domain_id=None):
         self.zone_name=zone_name
         self.session=get_session()
-        domain=self.session.query(Domains).filter(Domains.name==zone_name).first()
-        if not domain:
-            raise Exception("Unknown zone: "+zone_name)
-        self.domain_id=domain.id
+        if domain_id is None:
+            domain=self.session.query(Domains).filter(Domains.name==zone_name).first()
+            if not domain:
+                raise Exception("Unknown zone: "+zone_name)
+            domain_id=domain.id
+        self.domain_id=domain_id
+        #changes to write to journal with next serial
+        self.journal=[]
+        self.reset=False
     def get_soa(self):
         content=self._q(type="SOA", name='').first().content
         #content format is "primary hostmaster serial refresh retry expire ttl"
@@ -85,72 +191,273 @@ class PowerDNSZone(DNSZone):
     def drop(self):
         self._q().delete()
     def add(self, v):
+        change_date=int(time.time())
+        with self._transaction():
+            rec=self._add(v, change_date)
+            self.session.flush()
+            self._update_serial(change_date)
+        LOG.info("[%s]: Record (%s, %s, '%s') was added" %
+            (self.zone_name, rec.name, rec.type, rec.content))
+        return "ok"
+    def add_many(self, records):
+        change_date=int(time.time())
+        with self._transaction():
+            for v in records:
+                self._add(v, change_date)
+            self.session.flush()
+            self._update_serial(change_date)
+        LOG.info("[%s]: %d records were added" %
+            (self.zone_name, len(records)))
+        return "ok"
+    def load(self, records):
+        change_date=int(time.time())
+        count=0
+        with self._transaction():
+            chunk=[]
+            for v in records:
+                chunk.append(dict(domain_id=self.domain_id,
+                    name=DNSRecord.normname(self._fqdn(v.name)),
+                    type=v.type, content=v.content, ttl=v.ttl,
+                    prio=v.priority, change_date=change_date))
+                if len(chunk)>=FLAGS.dns_page_size:
+                    count+=self._insert(chunk)
+                    chunk=[]
+            if chunk:
+                count+=self._insert(chunk)
+            #loaded records aren't journaled one by one
+            self.reset=True
+            self._update_serial(change_date)
+        LOG.info("[%s]: %d records were loaded" % (self.zone_name, count))
+        return count
+    def get(self, name=None, type=None):
+        return [self._record(r) for r in self._q(name, type).all()]
+    def find(self, type, content):
+        return [self._record(r) for r in
+            self._q(type=type).filter(Records.content==content).all()]
+    def page(self, name=None, type=None, limit=None, marker=None):
+        #marker is id of the last record of previous page
+        q=self._q(name, type).order_by(Records.id)
+        if marker:
+            q=q.filter(Records.id>int(marker))
+        if not limit:
+            return ([self._record(r) for r in q.all()], None)
+        rows=q.limit(int(limit)+1).all()
+        marker=str(rows[int(limit)-1].id) if len(rows)>int(limit) else None
+        return ([self._record(r) for r in rows[:int(limit)]], marker)
+    def set(self, name, type, content="", priority="", ttl=""):
+        change_date=int(time.time())
+        with self._transaction():
+            rec=self._set(name, type, content, priority, ttl, change_date)
+            self.session.flush()
+            self._update_serial(change_date)
+        LOG.info("[%s]: Record (%s, %s) was changed" % 
+            (self.zone_name, rec.name, rec.type))
+        return "ok"
+    def batch(self, ops):
+        if not ops:
+            return []
+        change_date=int(time.time())
+        fqdns=set()
+        for op in ops:
+            try:
+                name=op[1].name if op[0]=="add" else op[1]
+                fqdns.add(DNSRecord.normname(self._fqdn(name)))
+            except (ValueError, IndexError, AttributeError):
+                #will be reported by operation itself
+                pass
+        res=[]
+        with self._transaction():
+            #all checks are done against this set, so failed operation
+            #doesn't break transaction for others
+            existing=set()
+            fqdns=list(fqdns)
+            for i in xrange(0, len(fqdns), IN_CHUNK):
+                existing.update((r.name, r.type) for r in
+                    self.session.query(Records.name, Records.type).filter(
+                        Records.domain_id==self.domain_id).filter(
+                        Records.name.in_(fqdns[i:i+IN_CHUNK])))
+            for op in ops:
+                try:
+                    if op[0]=="add":
+                        key=self._key(op[1].name, op[1].type)
+                        if key in existing:
+                            raise Exception("Record (%s, %s) already exists" % key)
+                        self._add(op[1], change_date)
+                        existing.add(key)
+                    elif op[0]=="edit":
+                        (name, type, content, priority, ttl)=op[1:]
+                        key=self._key(name, type)
+                        if key not in existing:
+                            raise Exception("Not found record (%s, %s)" % 
+                                (name, type))
+                        self._set(name, type, content, priority, ttl,
+                            change_date)
+                    elif op[0]=="delete":
+                        (name, type)=op[1:]
+                        key=self._key(name, type)
+                        if key not in existing:
+                            raise Exception("No records was deleted")
+                        self._delete(name, type)
+                        existing.discard(key)
+                    else:
+                        raise Exception("Incorrect action: " + str(op[0]))
+                    res.append("ok")
+                except Exception as e:
+                    res.append(e)
+            done=len([r for r in res if r=="ok"])
+            if done:
+                self.session.flush()
+                self._update_serial(change_date)
+        LOG.info("[%s]: %d of %d batch operations were applied" % 
+            (self.zone_name, done, len(ops)))
+        return res
+    def delete(self, name, type=None):
+        with self._transaction():
+            if not self._delete(name, type):
+                raise Exception("No records was deleted")
+            self._update_serial(int(time.time()))
+        LOG.info("[%s]: Record (%s, %s) was deleted" % 
+            (self.zone_name, name, type))
+        return "ok"
+    def delete_many(self, records):
+        deleted=0
+        with self._transaction():
+            for name, type in records:
+                deleted+=self._delete(name, type)
+            if deleted:
+                self._update_serial(int(time.time()))
+        LOG.info("[%s]: %d records were deleted" % (self.zone_name, deleted))
+        return "ok"
+    def _add(self, v, change_date):
         rec=Records()
         rec.domain_id=self.domain_id
-        rec.name=rec.name=v.name+"."+self.zone_name if v.name else self.zone_name
-        rec.name=DNSRecord.normname(rec.name)
+        rec.name=DNSRecord.normname(self._fqdn(v.name))
         rec.type=v.type
         rec.content=v.content
         rec.ttl=v.ttl
         rec.prio=v.priority
-        rec.change_date=int(time.time())
+        rec.change_date=change_date
         self.session.add(rec)
-        self.session.flush()
-        LOG.info("[%s]: Record (%s, %s, '%s') was added" %
-            (self.zone_name, rec.name, rec.type, rec.content))
-        self._update_serial(rec.change_date)
-        return "ok"
-    def get(self, name=None, type=None):
-        res=[]
-        for r in self._q(name, type).all():
-            if r.type=='SOA':
-                res.append(DNSSOARecord(*r.content.split()))
-            else:
-                res.append(DNSRecord(name=r.name, type=r.type, 
-                    content=r.content, priority=r.prio, ttl=r.ttl))
-        return res
-    def set(self, name, type, content="", priority="", ttl=""):
+        self._log("add", rec)
+        return rec
+    def _insert(self, rows):
+        #executemany of table insert, without ORM objects
+        self.session.execute(Records.__table__.insert(), rows)
+        return len(rows)
+    def _set(self, name, type, content, priority, ttl, change_date):
+        type=DNSRecord.normtype(type)
         if type=='SOA':
-            raise exception("Can't change SOA")
+            raise Exception("Can't change SOA")
+        if content:
+            DNSRecord.normcontent(type, content)
         rec=self._q(name, type).first()
         if not rec:
             raise Exception("Not found record (%s, %s)" % (name, type))
+        self._log("delete", rec)
         if content:
             rec.content=content
         if ttl:
             rec.ttl=ttl
         if priority:
             rec.prio=priority
-        rec.change_date=int(time.time())
+        rec.change_date=change_date
         self.session.merge(rec)
-        self.session.flush()
-        self._update_serial(rec.change_date)
-        LOG.info("[%s]: Record (%s, %s) was changed" % 
-            (self.zone_name, rec.name, rec.type))
-        return "ok"
-    def delete(self, name, type=None):
-        if self._q(name, type).delete():
-            LOG.info("[%s]: Record (%s, %s) was deleted" % 
-                (self.zone_name, name, type))
-            return "ok"
-        else:
-            raise Exception("No records was deleted")
+        self._log("add", rec)
+        return rec
+    def _delete(self, name, type):
+        if FLAGS.dns_journal_ttl:
+            for rec in self._q(name, type).all():
+                self._log("delete", rec)
+        return self._q(name, type).delete()
+    def _log(self, action, rec):
+        if FLAGS.dns_journal_ttl and rec.type!='SOA':
+            self.journal.append(dict(domain_id=self.domain_id,
+                action=action, name=rec.name, type=rec.type,
+                content=rec.content, ttl=rec.ttl, prio=rec.prio))
+    @contextlib.contextmanager
+    def _transaction(self):
+        """record changes, SOA serial and journal in one transaction.
+        Cached serial is invalidated after commit"""
+        try:
+            with self.session.begin():
+                yield
+        except Exception:
+            self.journal=[]
+            raise
+        SERIALS.invalidate(self.zone_name)
     def _update_serial(self, change_date):
-        #TODO change to get_soa
-        soa=self._q('', 'SOA').first()
+        #SOA row is locked till commit, so concurrent writers of zone
+        #get different serials
+        soa=self._q('', 'SOA').with_lockmode('update').first()
         v=soa.content.split()
         #TODO change this to ordinar set()
-        v[2]=change_date
+        #serial must grow even with several changes per second
+        v[2]=max(change_date, int(v[2])+1)
         content=" ".join((str(f) for f in v))
         #FIXME should change_date for SOA be changed here ?
         soa.update({"content":content, "change_date":change_date})
         self.session.flush()
+        self._write_journal(v[2], change_date)
+    def _write_journal(self, serial, change_date):
+        journal, self.journal=self.journal, []
+        if not FLAGS.dns_journal_ttl:
+            return
+        if self.reset:
+            journal=[dict(domain_id=self.domain_id, action="reset")]
+            self.reset=False
+        for row in journal:
+            row.update(serial=serial, change_date=change_date)
+        if journal:
+            self.session.execute(RecordChanges.__table__.insert(), journal)
+        if TRIMMED.get(self.domain_id, 0)+TRIM_INTERVAL<change_date:
+            TRIMMED[self.domain_id]=change_date
+            self._trim_journal(change_date-FLAGS.dns_journal_ttl)
+    def _trim_journal(self, before):
+        """replace changes older than ``before`` with reset"""
+        q=self.session.query(RecordChanges).filter(
+            RecordChanges.domain_id==self.domain_id)
+        serial=q.filter(RecordChanges.change_date<before).with_entities(
+            func.max(RecordChanges.serial)).scalar()
+        if serial is None:
+            return
+        q.filter(RecordChanges.serial<=serial).delete(
+            synchronize_session=False)
+        self.session.add(RecordChanges(domain_id=self.domain_id,
+            serial=serial, action="reset", change_date=before))
+        self.session.flush()
+    def changes(self, since):
+        serial=int(self.get_soa().serial)
+        since=int(since)
+        if since==serial:
+            return (serial, [])
+        q=self.session.query(RecordChanges).filter(
+            RecordChanges.domain_id==self.domain_id)
+        start=q.filter(RecordChanges.action=="reset").with_entities(
+            func.max(RecordChanges.serial)).scalar()
+        if start is None:
+            #zone was created before journal
+            self.session.add(RecordChanges(domain_id=self.domain_id,
+                serial=serial, action="reset", change_date=int(time.time())))
+            self.session.flush()
+        if since>serial or start is None or since<start:
+            return (serial, None)
+        return (serial, [dict(action=c.action, serial=c.serial,
+            record=self._record(c).to_dict()) for c in q.filter(
+            RecordChanges.serial>since).order_by(RecordChanges.id)])
     def _q(self, name=None, type=None):
         q=self.session.query(Records).filter(Records.domain_id==self.domain_id)
         if type:
             q=q.filter(Records.type==DNSRecord.normtype(type))
         if name is None:
             return q
-        fqdn=name+"."+self.zone_name if name else self.zone_name
-        return q.filter(Records.name==fqdn)
+        return q.filter(Records.name==self._fqdn(name))
+    @staticmethod
+    def _record(r):
+        if r.type=='SOA':
+            return DNSSOARecord(*r.content.split())
+        return DNSRecord.from_db(r.name, r.type, r.content, r.prio, r.ttl)
+    def _fqdn(self, name):
+        return name+"."+self.zone_name if name else self.zone_name
+    def _key(self, name, type):
+        return (DNSRecord.normname(self._fqdn(name)), DNSRecord.normtype(type))
 
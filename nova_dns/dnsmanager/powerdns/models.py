@@ -22,11 +22,12 @@ SQLAlchemy models for Nova PowerDNS.
 """
 
 from sqlalchemy.orm import object_mapper
-from sqlalchemy import Column, Integer, String
+from sqlalchemy import BigInteger, Column, Integer, String
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.schema import Index 
 
 from nova_dns.dnsmanager.powerdns.session import get_session, get_engine
+from nova_dns.dnsmanager.powerdns.session import remove_session
 
 
 BASE = declarative_base()
@@ -110,11 +111,72 @@ class Records(BASE, PowerDNSBase):
 
 Index('nametype_index', Records.name, Records.type, unique=True)
 
+class DomainLabels(BASE, PowerDNSBase):
+    """Zone name with labels in reverse order ("com.example." for
+    example.com), so zone with all subzones is a range of index"""
+    __tablename__ = 'domain_labels'
+    domain_id = Column(Integer, primary_key=True, autoincrement=False)
+    rname = Column(String(255), nullable=False, unique=True, index=True)
+
+    @staticmethod
+    def reverse(name):
+        return ".".join(reversed(name.split("."))) + "."
+
+    @staticmethod
+    def subtree(q, name):
+        """filter query to zone ``name`` and its subzones"""
+        rname = DomainLabels.reverse(name)
+        #all strings with prefix "com.example." are below "com.example/"
+        return q.filter(DomainLabels.rname >= rname).filter(
+            DomainLabels.rname < rname[:-1] + "/")
+
+class RecordChanges(BASE, PowerDNSBase):
+    """Journal of record changes: "add" and "delete" of records (edit is
+    both) with zone serial after the change. "reset" means that changes
+    before its serial are unknown (zone created, journal trimmed)"""
+    __tablename__ = 'record_changes'
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    domain_id = Column(Integer, nullable=False)
+    serial = Column(BigInteger, nullable=False)
+    action = Column(String(6), nullable=False)
+    name = Column(String(255))
+    type = Column(String(6))
+    content = Column(String(255))
+    ttl = Column(Integer)
+    prio = Column(Integer)
+    change_date = Column(Integer)
+
+Index('record_changes_serial', RecordChanges.domain_id, RecordChanges.serial)
+
 def register_models():
     """Register Models and create metadata."""
-    models = (Domains, Records)
+    models = (Domains, Records, DomainLabels, RecordChanges)
     engine = get_engine()
     for model in models:
         model.metadata.create_all(engine)
-    
-
+    index_domains()
+
+def index_domains(session=None):
+    """Add labels of domains created outside of nova-dns (or before
+    domain_labels table), remove labels of deleted domains. Reads whole
+    domains table, so it is run on start and then at most once per
+    dns_zone_cache_ttl"""
+    own_session = session is None
+    if own_session:
+        session = get_session()
+    with session.begin():
+        session.query(DomainLabels).filter(~DomainLabels.domain_id.in_(
+            session.query(Domains.id))).delete(synchronize_session=False)
+        missing = session.query(Domains.id, Domains.name).outerjoin(
+            DomainLabels, DomainLabels.domain_id == Domains.id).filter(
+            DomainLabels.domain_id == None).all()
+        if missing:
+            #labels of domains dropped and created again outside
+            session.query(DomainLabels).filter(DomainLabels.rname.in_(
+                [DomainLabels.reverse(n) for (i, n) in missing])).delete(
+                synchronize_session=False)
+        for (domain_id, name) in missing:
+            session.add(DomainLabels(domain_id=domain_id,
+                rname=DomainLabels.reverse(name)))
+    if own_session:
+        remove_session()
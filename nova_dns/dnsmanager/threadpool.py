@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+DNS manager wrapper which runs every call of manager and its zones in
+eventlet thread pool, so blocking database driver (MySQLdb) doesn't
+stop other green threads. Pool size is set by EVENTLET_THREADPOOL_SIZE
+environment variable (20 by default).
+"""
+
+from eventlet import tpool
+
+from nova_dns.dnsmanager import DNSManager, DNSZone
+from nova_dns import metrics
+
+
+def execute(fn, *args, **kwargs):
+    """ call fn in pool thread and wait for result in current green
+    thread. SQL statements are counted for operation of caller """
+    op=metrics.current_operation()
+    def call():
+        with metrics.operation(op):
+            return fn(*args, **kwargs)
+    return tpool.execute(call)
+
+
+class ThreadPoolManager(DNSManager):
+    def __init__(self, manager):
+        self.manager=manager
+    def init_host(self):
+        self.manager.init_host()
+    def list(self):
+        return self._call(self.manager.list)
+    def add(self, zone_name, soa={}):
+        return self._call(self.manager.add, zone_name, soa)
+    def drop(self, zone_name, force=False):
+        return self._call(self.manager.drop, zone_name, force)
+    def get(self, zone_name):
+        return ThreadPoolZone(self, self._call(self.manager.get, zone_name))
+    def dump(self, types):
+        #generator can't be moved between threads, read all at once
+        return iter(self._call(lambda: list(self.manager.dump(types))))
+    def release(self):
+        self.manager.release()
+    def _call(self, fn, *args, **kwargs):
+        #db session belongs to pool thread, it is released after every
+        #call as nobody else will release it
+        def call():
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.manager.release()
+        return execute(call)
+
+class ThreadPoolZone(DNSZone):
+    def __init__(self, manager, zone):
+        self.manager=manager
+        self.zone=zone
+        self.zone_name=zone.zone_name
+    def get_soa(self):
+        return self.manager._call(self.zone.get_soa)
+    def get_serial(self):
+        return self.manager._call(self.zone.get_serial)
+    def drop(self):
+        return self.manager._call(self.zone.drop)
+    def add(self, v):
+        return self.manager._call(self.zone.add, v)
+    def get(self, name=None, type=None):
+        return self.manager._call(self.zone.get, name, type)
+    def find(self, type, content):
+        return self.manager._call(self.zone.find, type, content)
+    def page(self, name=None, type=None, limit=None, marker=None):
+        return self.manager._call(self.zone.page, name, type, limit, marker)
+    def set(self, name, type, content="", priority="", ttl=""):
+        return self.manager._call(self.zone.set, name, type, content,
+            priority, ttl)
+    def delete(self, name, type=None):
+        return self.manager._call(self.zone.delete, name, type)
+    def add_many(self, records):
+        return self.manager._call(self.zone.add_many, records)
+    def delete_many(self, records):
+        return self.manager._call(self.zone.delete_many, records)
+    def batch(self, ops):
+        return self.manager._call(self.zone.batch, ops)
+    def changes(self, since):
+        return self.manager._call(self.zone.changes, since)
+    #load() isn't passed to pool: records iterator may read request
+    #body, so DNSZone.load writes it by add_many chunks
@@ -0,0 +1,166 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Write coalescing between listener and DNS manager
+"""
+
+import eventlet
+
+from collections import OrderedDict
+
+from nova import log as logging
+from nova_dns import metrics
+
+from nova_dns.dnsmanager import DNSRecord
+
+LOG = logging.getLogger("nova_dns.listener.coalesce")
+
+
+class WriteBuffer(object):
+    """
+    Collects DNSZone.batch() operations for ``window`` seconds and passes
+    only net changes to ``writer`` as {zone name: [operations]}.
+
+    Operations on the same (zone, name, type) supersede each other: a
+    later add replaces buffered add, delete cancels buffered add of not
+    yet written record, delete followed by add is written as both in one
+    batch. ``window`` 0 - there is no background flushing, operations
+    are written by explicit flush() (e.g. at the end of every event).
+    """
+    def __init__(self, writer, window):
+        self.writer=writer
+        self.window=window
+        #(zone name, name, type) => [operations]
+        self.ops=OrderedDict()
+        self.submitted=0
+        #totals since start
+        self.written=0
+        self.elided=0
+        self.thread=None
+
+    def start(self):
+        if self.window:
+            self.thread=eventlet.spawn(self._loop)
+
+    def stop(self):
+        if self.thread:
+            self.thread.kill()
+            self.thread=None
+        self.flush()
+
+    def put(self, zone_name, op):
+        key=self._key(zone_name, op)
+        ops=self.ops.get(key, [])
+        last=ops[-1][0] if ops else None
+        if op[0]=="delete":
+            #delete of never written record is nothing, otherwise only
+            #record which was there before buffering has to be deleted
+            ops=[] if ops and ops[0][0]=="add" else [op]
+        elif op[0]=="add" and last=="add":
+            ops[-1]=op
+        elif op[0]=="edit" and last in ("add", "edit"):
+            ops[-1]=self._merge(ops[-1], op)
+        else:
+            ops.append(op)
+        if ops:
+            self.ops[key]=ops
+        else:
+            self.ops.pop(key, None)
+        self.submitted+=1
+
+    def pending(self, zone_name, name, type):
+        """buffered operations for record"""
+        return list(self.ops.get((zone_name, self._name(name),
+            DNSRecord.normtype(type)), []))
+
+    def find(self, zone_name, type, content):
+        """names of records with ``content`` which are going to be
+        added to ``zone_name``"""
+        type=DNSRecord.normtype(type)
+        return [name for ((z, name, t), ops) in self.ops.iteritems()
+            if z==zone_name and t==type and ops[-1][0]=="add" and
+            ops[-1][1].content==content]
+
+    def flush(self):
+        """write net changes, return number of operations written. If
+        writer fails, changes are put back to buffer before the ones
+        buffered meanwhile and are written again by next flush (so writer
+        has to tolerate operations which were already applied)"""
+        if not self.submitted:
+            return 0
+        (ops, self.ops)=(self.ops, OrderedDict())
+        (submitted, self.submitted)=(self.submitted, 0)
+        byzone=OrderedDict()
+        for ((zone_name, name, type), key_ops) in ops.iteritems():
+            byzone.setdefault(zone_name, []).extend(key_ops)
+        count=sum(len(v) for v in byzone.itervalues())
+        self.written+=count
+        self.elided+=submitted-count
+        if submitted-count:
+            LOG.info("%d of %d changes were coalesced" %
+                (submitted-count, submitted))
+        if byzone:
+            try:
+                self.writer(byzone)
+            except Exception:
+                self._restore(ops, submitted, count)
+                raise
+        return count
+
+    def _restore(self, ops, submitted, count):
+        """put back ``ops`` taken by failed flush"""
+        (newer, self.ops)=(self.ops, ops)
+        newer_submitted=self.submitted
+        for ((zone_name, name, type), key_ops) in newer.iteritems():
+            for op in key_ops:
+                self.put(zone_name, op)
+        self.submitted=submitted+newer_submitted
+        self.written-=count
+        self.elided-=submitted-count
+
+    def _loop(self):
+        metrics.set_operation("listener:flush")
+        while True:
+            eventlet.sleep(self.window)
+            try:
+                self.flush()
+            except Exception:
+                LOG.exception("Failed to write dns changes")
+
+    @classmethod
+    def _key(cls, zone_name, op):
+        if op[0]=="add":
+            return (zone_name, cls._name(op[1].name), op[1].type)
+        return (zone_name, cls._name(op[1]), DNSRecord.normtype(op[2]))
+
+    @staticmethod
+    def _name(name):
+        return DNSRecord.normname(str(name)) if name else ''
+
+    @staticmethod
+    def _merge(op, edit):
+        (name, type, content, priority, ttl)=edit[1:]
+        if op[0]=="edit":
+            return ("edit", name, type, content or op[3], priority or op[4],
+                ttl or op[5])
+        r=op[1]
+        return ("add", DNSRecord(name=r.name, type=r.type,
+            content=content or r.content, priority=priority or r.priority,
+            ttl=ttl or r.ttl))
@@ -18,27 +18,32 @@
 #    along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 """Simple listener:
-- doesn't sync state with dns after restart
-- stateless"""
+- stateless, instances waiting for ip and records missed while service
+  was down are restored by reconciliation with nova database on start
+  and periodically"""
 
 import time
 import eventlet
+import eventlet.event
 import sqlalchemy.engine
+import sqlalchemy.sql
 
 from nova import log as logging
 from nova import utils
 from nova import flags
+from nova import ipv6
 from nova.openstack.common import cfg
 
 from nova_dns.dnsmanager import DNSRecord
+from nova_dns.dnsmanager import threadpool
 from nova_dns.listener import AMQPListener
+from nova_dns.listener.coalesce import WriteBuffer
+from nova_dns.listener.simple.reverse import ReverseZones
 from nova_dns import auth
-
-import netaddr
+from nova_dns import metrics
 
 LOG = logging.getLogger("nova_dns.listener.simple")
 FLAGS = flags.FLAGS
-SLEEP = 60 
 
 AUTH = auth.AUTH
 
@@ -47,90 +52,502 @@ opts = [
     cfg.ListOpt("dns_ns", default=["ns1:127.0.0.1"], 
 	help="Name servers, in format ns1:ip1, ns2:ip2"),
     cfg.BoolOpt('dns_ptr', default=False, help='Manage PTR records'),
+    cfg.BoolOpt('dns_ipv6', default=False,
+	help="Manage AAAA (and ip6.arpa PTR) records of instances in networks "
+	"with cidr_v6"),
     cfg.ListOpt('dns_ptr_zones', default=[], 
-	help="Classless delegation networks in format ip_addr/network")
+	help="Classless delegation networks in format ip_addr/network, "
+	"IPv6 networks have to be on nibble boundary"),
+    cfg.IntOpt('dns_poll_chunk', default=500,
+	help="Max number of pending instances looked up by one query"),
+    cfg.IntOpt('dns_poll_min_interval', default=2,
+	help="Seconds before first check of ip address of new instance"),
+    cfg.IntOpt('dns_poll_max_interval', default=60,
+	help="Max seconds between checks of ip address of pending instance"),
+    cfg.BoolOpt('dns_reconcile', default=True,
+	help="Sync dns records with nova database on start"),
+    cfg.IntOpt('dns_reconcile_interval', default=3600,
+	help="Seconds between syncs with nova database, 0 - only on start"),
+    cfg.BoolOpt('dns_reconcile_delete', default=False,
+	help="Delete A/AAAA/PTR records of unknown instances while syncing"),
+    cfg.IntOpt('dns_reconcile_batch', default=500,
+	help="Max number of record changes written at once while syncing"),
+    cfg.StrOpt('dns_floating_zone', default='',
+	help="Zone for A records of floating ips, empty - floating ips are not "
+	"managed. Needs 'network.#' in dns_routing_keys"),
+    cfg.IntOpt('dns_coalesce_window', default=2,
+	help="Seconds to collect record changes before writing them, changes "
+	"of the same record inside window are collapsed. 0 - write at the end "
+	"of every event")
 ]
 FLAGS.register_opts(opts)
 
+#fixed IPv6 addresses aren't stored by nova, they are computed from network
+#prefix and mac of virtual interface
+V6_SQL="""
+    select i.hostname, i.project_id, i.uuid, n.cidr_v6, v.address as mac
+    from instances i, virtual_interfaces v, networks n
+    where i.id=v.instance_id and v.network_id=n.id and n.cidr_v6 is not null
+        and i.deleted=0 and v.deleted=0"""
+
+FLOATING_SQL="""
+    select fl.address, i.hostname, i.project_id
+    from floating_ips fl, fixed_ips f, instances i
+    where fl.fixed_ip_id=f.id and f.instance_id=i.id and i.deleted=0"""
+
+#instance which gets floating ip, association may be not saved by nova yet
+FIXED_SQL="""
+    select i.hostname, i.project_id
+    from fixed_ips f, instances i
+    where f.instance_id=i.id and f.address=:address and i.deleted=0"""
+
 class Listener(AMQPListener):
     def __init__(self):
+        #instance uuid => (time of next check, current backoff delay)
         self.pending={}
+        self.wakeup=eventlet.event.Event()
+        self.running=True
+        self.ptr_zones=ReverseZones(FLAGS.dns_ptr_zones)
         self.conn=sqlalchemy.engine.create_engine(FLAGS.sql_connection, 
             pool_recycle=FLAGS.sql_idle_timeout, echo=False)
+        metrics.instrument_engine(self.conn, "nova")
         dnsmanager_class=utils.import_class(FLAGS.dns_manager);
         self.dnsmanager=dnsmanager_class()
+        if FLAGS.dns_db_threadpool:
+            self.dnsmanager=threadpool.ThreadPoolManager(self.dnsmanager)
+        self.buffer=WriteBuffer(self._write, FLAGS.dns_coalesce_window)
+        self.buffer.start()
+        metrics.METRICS.gauge("nova_dns_listener_pending_instances",
+            lambda: len(self.pending))
+        metrics.METRICS.gauge("nova_dns_listener_writes",
+            lambda: {"written": self.buffer.written,
+                "elided": self.buffer.elided,
+                "buffered": len(self.buffer.ops)})
         self.eventlet = eventlet.spawn(self._pollip)
+        if FLAGS.dns_reconcile:
+            eventlet.spawn(self._reconcile_loop)
+
+    def stop(self):
+        """stop poll and sync loops, write buffered changes"""
+        self.running=False
+        if not self.wakeup.ready():
+            self.wakeup.send()
+        self.buffer.stop()
 
     def event(self, e):
+        try:
+            self._event(e)
+            if not self.buffer.window:
+                self.buffer.flush()
+        finally:
+            self.dnsmanager.release()
+
+    def _event(self, e):
         method = e.get("method", "<unknown>")
         id = e["args"].get("instance_uuid", None)
         if method=="run_instance":
             LOG.info("Run instance %s. Waiting on assing ip address" % (str(id),))
-            self.pending[id]=1
+            self._schedule(id)
+        elif method=="allocate_for_instance" and id:
+            #network.* notification - fixed ip is being allocated right now,
+            #check it soon regardless of backoff
+            LOG.debug("Allocating ip for instance %s" % (id,))
+            self._schedule(id)
         elif method=="terminate_instance":
             if self.pending.has_key(id): del self.pending[id]
-            rec = self.conn.execute("select hostname, project_id "+
-                "from instances where uuid=%s", id).first()
+            rows = self._select(sqlalchemy.sql.text(
+                "select hostname, project_id from instances where uuid=:uuid"),
+                uuid=id)
+            rec = rows[0] if rows else None
             if not rec:
                 LOG.error('Unknown id: '+id)
             else:
+                LOG.info("Instance %s hostname '%s' was terminated" %
+                    (id, rec.hostname))
+                #TODO check if record was added/changed by admin
                 try:
-                    LOG.info("Instance %s hostname '%s' was terminated" %
-                        (id, rec.hostname))
-                    #TODO check if record was added/changed by admin
-                    zonename = AUTH.tenant2zonename(rec.project_id)
-                    zone=self.dnsmanager.get(zonename)
+                    zonename=DNSRecord.normname(
+                        AUTH.tenant2zonename(rec.project_id))
+                    hostname=DNSRecord.normname(rec.hostname)
+                except ValueError as e:
+                    LOG.warn(str(e))
+                    return
+                for type in self._address_types():
+                    contents=self._contents(zonename, hostname, type)
+                    if not contents:
+                        continue
                     if FLAGS.dns_ptr:
-                        ip = zone.get(rec.hostname, 'A')[0].content
-                        (ptr_zonename, octet) = self.ip2zone(ip)
-                        self.dnsmanager.get(ptr_zonename).delete(str(octet), 'PTR')
-                    zone.delete(rec.hostname, 'A')
-                except:
-                    pass
+                        for content in contents:
+                            (ptr_zonename, name) = self.ip2zone(content)
+                            self.buffer.put(ptr_zonename,
+                                ("delete", str(name), 'PTR'))
+                    self.buffer.put(zonename, ("delete", hostname, type))
+        elif method in ("associate_floating_ip", "disassociate_floating_ip") \
+                and FLAGS.dns_floating_zone:
+            address=e["args"]["floating_address"]
+            LOG.info("Floating ip %s: %s" % (address, method))
+            self._floating(address, e["args"].get("fixed_address", None)
+                if method=="associate_floating_ip" else None)
         else:
             LOG.debug("Skip message with method: "+method)
+
+    def _schedule(self, uuid, delay=None):
+        """check ip of instance ``uuid`` after ``delay`` seconds
+        (FLAGS.dns_poll_min_interval by default) and wake up poller"""
+        if delay is None:
+            delay=FLAGS.dns_poll_min_interval
+        self.pending[uuid]=(time.time()+delay, delay)
+        if not self.wakeup.ready():
+            self.wakeup.send()
+
     def _pollip(self):
-        while True:
-            time.sleep(SLEEP)
-            if not len(self.pending):
-                continue
-            #TODO change select to i.id in ( pendings ) to speed up
-            for r in self.conn.execute("""
-                select i.hostname, i.id, i.project_id, i.uuid, f.address
-                from instances i, fixed_ips f
-                where i.id=f.instance_id"""):
-                if r.uuid not in self.pending: continue
-                LOG.info("Instance %s hostname %s adding ip %s" %
-                    (r.uuid, r.hostname, r.address))
-                del self.pending[r.uuid]
-                zones_list=self.dnsmanager.list()
-                if FLAGS.dns_zone not in zones_list:
-                    #Lazy create main zone and populate by ns
-                    self._add_zone(FLAGS.dns_zone)
-                zonename = AUTH.tenant2zonename(r.project_id)
-                if zonename not in zones_list:
-                    self._add_zone(zonename)
+        while self.running:
+            now=time.time()
+            due=[uuid for uuid, (t, delay) in self.pending.items() if t<=now]
+            if due:
+                metrics.set_operation("listener:poll")
                 try:
-                    self.dnsmanager.get(zonename).add(
-                        DNSRecord(name=r.hostname, type='A', content=r.address))
-                except ValueError as e:
-                    LOG.warn(str(e))
-                except:
-                    pass
-                if FLAGS.dns_ptr:
-                    (ptr_zonename, octet) = self.ip2zone(r.address)
-                    if ptr_zonename not in zones_list:
-                        self._add_zone(ptr_zonename)
-                    self.dnsmanager.get(ptr_zonename).add(DNSRecord(name=octet, 
-                        type='PTR', content=r.hostname+'.'+zonename))
+                    with metrics.METRICS.timer("nova_dns_listener_poll_seconds"):
+                        self._poll(due)
+                except Exception:
+                    LOG.exception("Failed to poll ip addresses")
+                finally:
+                    self.dnsmanager.release()
+                for uuid in due:
+                    if uuid in self.pending and self.pending[uuid][0]<=now:
+                        #still no ip - exponential backoff
+                        delay=min(self.pending[uuid][1]*2,
+                            FLAGS.dns_poll_max_interval)
+                        self.pending[uuid]=(now+delay, delay)
+                continue
+            if self.pending:
+                timeout=min(t for t, delay in self.pending.values())-now
+            else:
+                #nothing to do - sleep until next run_instance
+                timeout=None
+            with eventlet.Timeout(timeout, False):
+                self.wakeup.wait()
+            self.wakeup=eventlet.event.Event()
+
+    def _poll(self, uuids):
+        instances=[]
+        found=[]
+        for r in self._pending_instances(uuids):
+            if r.uuid not in self.pending: continue
+            LOG.info("Instance %s hostname %s adding ip %s" %
+                (r.uuid, r.hostname, r.address))
+            instances.append((r.hostname, r.project_id, r.address))
+            found.append(r.uuid)
+        for uuid in found:
+            self.pending.pop(uuid, None)
+        if found and FLAGS.dns_ipv6:
+            instances.extend(self._ipv6_addresses(self._select_chunked(
+                V6_SQL + " and i.uuid in (%s)", found)))
+        for (zone_name, name, type, content) in self._records(instances):
+            self.buffer.put(zone_name, ("add",
+                DNSRecord(name=name, type=type, content=content)))
+        if not self.buffer.window:
+            #all records of the poll in one batch per zone
+            self.buffer.flush()
+
+    def _pending_instances(self, uuids):
+        """return (hostname, id, project_id, uuid, address) rows for
+        instances from ``uuids`` which already have fixed ip. Only pending
+        instances are selected, in chunks of FLAGS.dns_poll_chunk"""
+        return self._select_chunked("""
+            select i.hostname, i.id, i.project_id, i.uuid, f.address
+            from instances i, fixed_ips f
+            where i.id=f.instance_id and i.deleted=0 and f.deleted=0
+                and i.uuid in (%s)""", uuids)
+
+    def _select_chunked(self, sql, uuids):
+        """run ``sql`` with "in (%s)" placeholder for FLAGS.dns_poll_chunk
+        sized chunks of ``uuids``, return all rows"""
+        res=[]
+        for i in xrange(0, len(uuids), FLAGS.dns_poll_chunk):
+            chunk=uuids[i:i+FLAGS.dns_poll_chunk]
+            params=dict(("u%d" % n, uuid) for n, uuid in enumerate(chunk))
+            q=sqlalchemy.sql.text(sql %
+                ", ".join(":"+p for p in sorted(params)))
+            res.extend(self._select(q, **params))
+        return res
+
+    def _select(self, sql, **params):
+        """return all rows of ``sql``, in thread pool with
+        FLAGS.dns_db_threadpool"""
+        def select():
+            return self.conn.execute(sql, **params).fetchall()
+        if FLAGS.dns_db_threadpool:
+            return threadpool.execute(select)
+        return select()
+
+    @staticmethod
+    def _ipv6_addresses(rows):
+        """return [(hostname, project_id, address)] for V6_SQL ``rows``,
+        addresses are derived from mac like nova does (nova.ipv6)"""
+        res=[]
+        for r in rows:
+            try:
+                res.append((r.hostname, r.project_id,
+                    str(ipv6.to_global(r.cidr_v6, r.mac, r.project_id))))
+            except Exception as e:
+                LOG.warn("Can't get IPv6 address of %s: %s" % (r.hostname, e))
+        return res
+
+    def _records(self, instances):
+        """return [(zone name, name in zone, type, content)] - A or AAAA
+        and PTR records of [(hostname, project_id, address)]. Reverse
+        names of all addresses are computed by one lookup_many() call"""
+        res=[]
+        ptrs=[]
+        for (hostname, project_id, address) in instances:
+            try:
+                zonename=DNSRecord.normname(AUTH.tenant2zonename(project_id))
+                hostname=DNSRecord.normname(hostname)
+            except ValueError as e:
+                LOG.warn(str(e))
+                continue
+            res.append((zonename, hostname, 'AAAA' if ':' in address else 'A',
+                address))
+            ptrs.append((address, hostname+'.'+zonename))
+        if FLAGS.dns_ptr and ptrs:
+            reverse=self.ptr_zones.lookup_many([a for (a, fqdn) in ptrs])
+            for ((ptr_zonename, name), (address, fqdn)) in zip(reverse, ptrs):
+                res.append((ptr_zonename, str(name), 'PTR', fqdn))
+        return res
+
+    @staticmethod
+    def _address_types():
+        return ['A', 'AAAA'] if FLAGS.dns_ipv6 else ['A']
+
+    def _floating(self, address, fixed_address=None):
+        """queue record changes of floating ``address``: delete records
+        of previous owner, add records of instance with ``fixed_address``.
+        Association and disassociation inside dns_coalesce_window cancel
+        each other in buffer"""
+        zone_name=FLAGS.dns_floating_zone
+        old=self.buffer.find(zone_name, 'A', address)
+        if not old:
+            try:
+                old=[self._relname(r.name, zone_name) for r in
+                    self.dnsmanager.get(zone_name).find('A', address)]
+            except Exception:
+                old=[]
+        new=[]
+        if fixed_address:
+            new=self._floating_records([(address, r.hostname, r.project_id)
+                for r in self._select(sqlalchemy.sql.text(FIXED_SQL),
+                    address=fixed_address)])
+        if old==[name for (zone, name, type, content) in new if type=='A']:
+            return
+        for name in old:
+            self.buffer.put(zone_name, ("delete", name, 'A'))
+        if old and FLAGS.dns_ptr:
+            (ptr_zonename, ptr)=self.ip2zone(address)
+            self.buffer.put(ptr_zonename, ("delete", str(ptr), 'PTR'))
+        for (zone, name, type, content) in new:
+            self.buffer.put(zone, ("add",
+                DNSRecord(name=name, type=type, content=content)))
+
+    def _floating_records(self, rows):
+        """return [(zone name, name in zone, type, content)] - A and PTR
+        records of floating ips for [(address, hostname, project_id)].
+        Name of instance in floating zone is hostname.project"""
+        names=[]
+        for (address, hostname, project_id) in rows:
+            try:
+                zonename=DNSRecord.normname(AUTH.tenant2zonename(project_id))
+                hostname=DNSRecord.normname(hostname)
+            except ValueError as e:
+                LOG.warn(str(e))
+                continue
+            names.append((address, self._floating_name(hostname, zonename)))
+        zone_name=FLAGS.dns_floating_zone
+        res=[(zone_name, name, 'A', address) for (address, name) in names]
+        if FLAGS.dns_ptr and names:
+            reverse=self.ptr_zones.lookup_many([a for (a, name) in names])
+            for ((ptr_zonename, ptr), (address, name)) in zip(reverse, names):
+                res.append((ptr_zonename, str(ptr), 'PTR',
+                    name+'.'+zone_name))
+        return res
+
+    @staticmethod
+    def _floating_name(hostname, zonename):
+        """name of instance in floating zone - hostname.project"""
+        if zonename.endswith('.'+FLAGS.dns_zone):
+            zonename=zonename[:-len(FLAGS.dns_zone)-1]
+        return hostname+'.'+zonename
+
+    def _reconcile_loop(self):
+        metrics.set_operation("listener:reconcile")
+        while self.running:
+            try:
+                with metrics.METRICS.timer(
+                        "nova_dns_listener_reconcile_seconds"):
+                    self.reconcile()
+            except Exception:
+                LOG.exception("Failed to sync dns with nova")
+            finally:
+                self.dnsmanager.release()
+            if not FLAGS.dns_reconcile_interval:
+                return
+            eventlet.sleep(FLAGS.dns_reconcile_interval)
+
+    def reconcile(self):
+        """
+        Compare A/AAAA/PTR records of all instances with dns in bulk (one query
+        to nova and one to dns manager) and write only the difference.
+        Instances still waiting for ip are added to pending.
+        """
+        #buffered changes have to be in dns before comparing
+        self.buffer.flush()
+        types=self._address_types()+(['PTR'] if FLAGS.dns_ptr else [])
+        (desired, waiting)=self._nova_records()
+        actual={}
+        for (zone_name, r) in self.dnsmanager.dump(types):
+            actual[(zone_name, r.name, r.type)]=r.content
+        ops={}
+        for (key, contents) in desired.iteritems():
+            content=actual.get(key, None)
+            if content in contents:
+                continue
+            (zone_name, fqdn, type)=key
+            name=self._relname(fqdn, zone_name)
+            if content is not None:
+                ops.setdefault(zone_name, []).append(("delete", name, type))
+            ops.setdefault(zone_name, []).append(("add",
+                DNSRecord(name=name, type=type, content=contents[0])))
+        if FLAGS.dns_reconcile_delete:
+            names=self._instance_names()
+            for (key, content) in actual.iteritems():
+                (zone_name, fqdn, type)=key
+                if key not in desired and \
+                        self._is_managed(key, content, names):
+                    ops.setdefault(zone_name, []).append(("delete",
+                        self._relname(fqdn, zone_name), type))
+        added=self._apply(ops)
+        for uuid in waiting:
+            if uuid not in self.pending:
+                self._schedule(uuid)
+        LOG.info("Synced with nova: %d records, %d changes written, "
+            "%d instances waiting for ip" % (len(desired), added, len(waiting)))
+
+    def _nova_records(self):
+        """return ({(zone name, fqdn, type): [contents]}, [uuids of
+        instances without ip])"""
+        instances=[]
+        waiting=[]
+        for r in self._select("""
+            select i.uuid, i.hostname, i.project_id, i.vm_state, f.address
+            from instances i left outer join fixed_ips f
+                on i.id=f.instance_id and f.deleted=0
+            where i.deleted=0"""):
+            if r.address is None:
+                if r.vm_state=="building":
+                    waiting.append(r.uuid)
+                continue
+            instances.append((r.hostname, r.project_id, r.address))
+        if FLAGS.dns_ipv6:
+            instances.extend(self._ipv6_addresses(self._select(V6_SQL)))
+        records=self._records(instances)
+        if FLAGS.dns_floating_zone:
+            records.extend(self._floating_records(
+                self._select(FLOATING_SQL)))
+        desired={}
+        for (zone_name, name, type, content) in records:
+            fqdn=name+'.'+zone_name if name else zone_name
+            if type=='PTR':
+                desired[(zone_name, fqdn, type)]=[content]
+            else:
+                desired.setdefault((zone_name, fqdn, type), []).append(content)
+        return (desired, waiting)
+
+    def _write(self, ops):
+        """WriteBuffer writer"""
+        try:
+            self._apply(ops)
+        finally:
+            self.dnsmanager.release()
+
+    def _contents(self, zone_name, name, type):
+        """contents of record, buffered changes are taken into account"""
+        ops=self.buffer.pending(zone_name, name, type)
+        if ops and ops[-1][0]=="add":
+            return [ops[-1][1].content]
+        if ops and ops[-1][0]=="delete":
+            return []
+        try:
+            return [r.content for r in
+                self.dnsmanager.get(zone_name).get(name, type)]
+        except Exception:
+            return []
+
+    def _apply(self, ops):
+        """write {zone name: [batch operations]}, return number of
+        operations done"""
+        done=0
+        if not ops:
+            return done
+        zones_list=set(self.dnsmanager.list())
+        if FLAGS.dns_zone not in zones_list:
+            self._add_zone(FLAGS.dns_zone)
+        for (zone_name, zone_ops) in ops.iteritems():
+            if zone_name not in zones_list:
+                self._add_zone(zone_name)
+            zone=self.dnsmanager.get(zone_name)
+            for i in xrange(0, len(zone_ops), FLAGS.dns_reconcile_batch):
+                for r in zone.batch(zone_ops[i:i+FLAGS.dns_reconcile_batch]):
+                    if isinstance(r, Exception):
+                        LOG.warn("[%s]: %s" % (zone_name, str(r)))
+                    else:
+                        done+=1
+        return done
+
+    def _instance_names(self):
+        """fqdns of all instances known to nova (deleted too) in project
+        and floating zones. Only records with these names are created by
+        this listener, records added by users are never deleted"""
+        names=set()
+        for r in self._select(
+                "select distinct hostname, project_id from instances"):
+            try:
+                zonename=DNSRecord.normname(AUTH.tenant2zonename(r.project_id))
+                hostname=DNSRecord.normname(r.hostname)
+            except ValueError as e:
+                LOG.warn(str(e))
+                continue
+            names.add(hostname+'.'+zonename)
+            if FLAGS.dns_floating_zone:
+                names.add(self._floating_name(hostname, zonename)+'.'+
+                    FLAGS.dns_floating_zone)
+        return names
+
+    def _is_managed(self, key, content, names):
+        """True if record was created by this listener: A/AAAA record of
+        instance in project or floating zone, PTR record pointing to
+        instance. ``names`` are fqdns of instances (_instance_names)"""
+        (zone_name, fqdn, type)=key
+        if type=='A' and zone_name==FLAGS.dns_floating_zone:
+            return fqdn in names
+        if type in ('A', 'AAAA'):
+            return zone_name.endswith('.'+FLAGS.dns_zone) and fqdn in names
+        return type=='PTR' and (zone_name.endswith('.in-addr.arpa') or
+            zone_name.endswith('.ip6.arpa')) and \
+            str(content).lower().rstrip('.') in names
+
+    @staticmethod
+    def _relname(fqdn, zone_name):
+        return fqdn[:-len(zone_name)-1] if fqdn!=zone_name else ''
 
     def _add_zone(self, name):
         try:
             self.dnsmanager.add(name)
             zone=self.dnsmanager.get(name)
+            records=[]
             for ns in FLAGS.dns_ns:
                 (name,content)=ns.split(':',2)
-                zone.add(DNSRecord(name=name, type="NS", content=content))
+                records.append(DNSRecord(name=name, type="NS", content=content))
+            zone.add_many(records)
         except ValueError as e:
             LOG.warn(str(e))
         except:
@@ -139,15 +556,4 @@ class Listener(AMQPListener):
 
     def ip2zone(self, ip):
         #TODO check /cidr >= 24
-        addr = netaddr.IPAddress(ip) 
-        for zone in FLAGS.dns_ptr_zones: 
-            #TODO prepare netaddr one time on service start
-            zoneaddr = netaddr.IPNetwork(zone)
-            if addr not in zoneaddr:
-                continue
-            cidr = str(zoneaddr.cidr).split('/')[1]
-            w = zoneaddr.cidr.ip.words
-            return ("%s-%s.%s.%s.%s.in-addr.arpa" % 
-                (w[3], cidr, w[2], w[1], w[0]), addr.words[-1])
-        w = addr.words
-        return ("%s.%s.%s.in-addr.arpa" % (w[2], w[1], w[0]), w[3])
+        return self.ptr_zones.lookup(ip)
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Reverse zones of ip addresses
+"""
+
+import socket
+import struct
+
+import netaddr
+
+
+def ip2int(ip):
+    """return (version, integer value) of ip address string"""
+    if ':' in ip:
+        (hi, lo) = struct.unpack('!QQ', socket.inet_pton(socket.AF_INET6, ip))
+        return (6, hi << 64 | lo)
+    return (4, struct.unpack('!I', socket.inet_aton(ip))[0])
+
+
+#byte => its two nibbles in ip6.arpa order, "low.high"
+BYTE_NIBBLES = ["%x.%x" % (b & 15, b >> 4) for b in xrange(256)]
+
+
+def nibbles(value, count):
+    """return ``count`` low nibbles of ``value`` as ip6.arpa name part
+    (least significant first, dot separated)"""
+    res = [BYTE_NIBBLES[value >> shift & 255]
+        for shift in xrange(0, count / 2 * 8, 8)]
+    if count % 2:
+        res.append("%x" % (value >> (count - 1) * 4 & 15))
+    return ".".join(res)
+
+
+class ReverseZones(object):
+    """
+    Longest prefix match of ip address to reverse zone.
+
+    Built once from list of "ip_addr/prefix" networks. Networks are grouped
+    by prefix length, lookup costs one dict lookup per distinct prefix
+    length. Addresses out of all networks go to /24 in-addr.arpa and /64
+    ip6.arpa zones.
+    """
+
+    BITS = {4: 32, 6: 128}
+    DEFAULT_PREFIX = {4: 24, 6: 64}
+
+    def __init__(self, networks):
+        tables = {4: {}, 6: {}}
+        for net in networks:
+            net = netaddr.IPNetwork(net)
+            if net.version == 6 and net.prefixlen % 4:
+                raise ValueError("IPv6 reverse zone must be on nibble "
+                    "boundary: %s" % (net,))
+            tables[net.version].setdefault(net.prefixlen, {})[
+                int(net.network)] = self._zone_name(net)
+        #[(shift, {network: zone name})] - longest prefix first
+        self.prefixes = {}
+        for (version, table) in tables.iteritems():
+            self.prefixes[version] = [(self.BITS[version] - prefixlen,
+                table[prefixlen]) for prefixlen in sorted(table, reverse=True)]
+
+    @staticmethod
+    def _zone_name(net):
+        if net.version == 4:
+            w = net.network.words
+            return "%s-%s.%s.%s.%s.in-addr.arpa" % (w[3], net.prefixlen,
+                w[2], w[1], w[0])
+        return nibbles(int(net.network) >> (128 - net.prefixlen),
+            net.prefixlen / 4) + ".ip6.arpa"
+
+    def lookup(self, ip):
+        """return (reverse zone name, record name in zone) for ``ip``"""
+        (version, value) = ip2int(ip)
+        return self.lookup_int(version, value)
+
+    def lookup_many(self, ips):
+        """return list of lookup() results for list of ``ips``. Zone
+        tables and nibble table are shared by the whole list, no
+        per-address parsing objects are created"""
+        lookup = self.lookup_int
+        return [lookup(*ip2int(ip)) for ip in ips]
+
+    def lookup_int(self, version, value):
+        for (shift, table) in self.prefixes[version]:
+            zone = table.get(value >> shift << shift, None)
+            if zone is not None:
+                return (zone, self._name(version, value, shift))
+        if version == 4:
+            return ("%s.%s.%s.in-addr.arpa" % (value >> 8 & 255,
+                value >> 16 & 255, value >> 24), value & 255)
+        return (nibbles(value >> 64, 16) + ".ip6.arpa", nibbles(value, 16))
+
+    @staticmethod
+    def _name(version, value, shift):
+        if version == 4:
+            #classless delegation zones hold last octet
+            return value & 255
+        return nibbles(value, shift / 4)
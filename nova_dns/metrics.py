@@ -0,0 +1,173 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Process-wide metrics in Prometheus text format:
+ - SQL statements and time, by logical operation (REST action, AMQP
+   method, listener poll/reconcile) running in current green thread
+ - REST action and AMQP event timings
+ - gauges read on every scrape (connection pool, queues)
+"""
+
+import contextlib
+import time
+
+import eventlet.corolocal
+import eventlet.patcher
+import sqlalchemy.event
+
+_local = eventlet.corolocal.local()
+#metrics are updated from thread pool too (dns_db_threadpool), so the
+#lock has to be real one even if threading is monkey patched
+_threading = eventlet.patcher.original("threading")
+
+
+class Metrics(object):
+    def __init__(self):
+        #name => {labels: value}
+        self.counters = {}
+        #name => {labels: [count, sum]}
+        self.summaries = {}
+        #name => function returning {labels: value}
+        self.gauges = {}
+        #guards counters and summaries, never held while green thread
+        #may switch
+        self.lock = _threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.counters.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            values = self.summaries.setdefault(name, {})
+            v = values.get(key)
+            if v is None:
+                values[key] = [1, value]
+            else:
+                v[0] += 1
+                v[1] += value
+
+    def gauge(self, name, fn):
+        """``fn`` returns number or {label value: number} for label
+        "state", it is called on every render()"""
+        self.gauges[name] = fn
+
+    @contextlib.contextmanager
+    def timer(self, name, **labels):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.observe(name, time.time() - start, **labels)
+
+    def render(self):
+        with self.lock:
+            counters = dict((name, values.items())
+                for (name, values) in self.counters.iteritems())
+            summaries = dict((name, [(labels, tuple(v))
+                for (labels, v) in values.iteritems()])
+                for (name, values) in self.summaries.iteritems())
+        lines = []
+        for name in sorted(counters):
+            lines.append("# TYPE %s counter" % name)
+            for (labels, value) in sorted(counters[name]):
+                lines.append("%s%s %s" % (name, _labels(labels), _num(value)))
+        for name in sorted(summaries):
+            lines.append("# TYPE %s summary" % name)
+            for (labels, (count, total)) in sorted(summaries[name]):
+                lines.append("%s_count%s %d" % (name, _labels(labels), count))
+                lines.append("%s_sum%s %s" % (name, _labels(labels),
+                    _num(total)))
+        for name in sorted(self.gauges):
+            try:
+                values = self.gauges[name]()
+            except Exception:
+                continue
+            if values == {}:
+                continue
+            lines.append("# TYPE %s gauge" % name)
+            if not isinstance(values, dict):
+                values = {None: values}
+            for (state, value) in sorted(values.items()):
+                labels = (("state", state),) if state is not None else ()
+                lines.append("%s%s %s" % (name, _labels(labels), _num(value)))
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self.lock:
+            self.counters.clear()
+            self.summaries.clear()
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    return "{%s}" % ",".join('%s="%s"' % (k, str(v).replace("\\", "\\\\")
+        .replace('"', '\\"')) for (k, v) in labels)
+
+
+def _num(value):
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+METRICS = Metrics()
+
+
+@contextlib.contextmanager
+def operation(name):
+    """SQL statements of current green thread are counted for ``name``"""
+    prev = getattr(_local, "operation", None)
+    _local.operation = name
+    try:
+        yield
+    finally:
+        _local.operation = prev
+
+
+def set_operation(name):
+    """set operation of current green thread, return previous one"""
+    prev = getattr(_local, "operation", None)
+    _local.operation = name
+    return prev
+
+
+def current_operation():
+    return getattr(_local, "operation", None) or "other"
+
+
+def instrument_engine(engine, db):
+    """count statements and time of sqlalchemy ``engine`` by
+    operation"""
+    def before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["nova_dns_start"] = time.time()
+
+    def after(conn, cursor, statement, parameters, context, executemany):
+        op = current_operation()
+        METRICS.inc("nova_dns_sql_statements_total", db=db, operation=op)
+        start = conn.info.pop("nova_dns_start", None)
+        if start is not None:
+            METRICS.inc("nova_dns_sql_seconds_total", time.time() - start,
+                db=db, operation=op)
+
+    sqlalchemy.event.listen(engine, "before_cursor_execute", before)
+    sqlalchemy.event.listen(engine, "after_cursor_execute", after)
@@ -0,0 +1,217 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Zone files (RFC 1035 master file format): dump records of zone and
+parse zone file into records. Both work with iterators, so zone of any
+size is processed with bounded memory.
+
+Supported: $ORIGIN and $TTL directives, comments, multi-line records in
+parentheses, quoted strings, omitted owner/ttl/class, ttl units (1h, 2d).
+Only IN class, $INCLUDE is not supported.
+"""
+
+import re
+
+from nova_dns.dnsmanager import DNSRecord, DNSSOARecord
+
+
+#types with domain name in content (last field)
+NAME_TYPES = set(("CNAME", "NS", "PTR", "MX", "SRV"))
+TEXT_TYPES = set(("TXT", "SPF"))
+
+_TOKEN = re.compile(r'"(?:[^"\\]|\\.)*"|[()]|;.*|[^\s();"]+')
+_TTL = re.compile(r'(\d+)([smhdw]?)', re.I)
+_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def dump(zone_name, soa, records):
+    """yield lines of zone file: SOA ``soa`` and ``records`` (with fully
+    qualified names, SOA records are skipped) of zone ``zone_name``"""
+    yield "$ORIGIN %s.\n" % zone_name
+    yield "@\t%s\tIN\tSOA\t%s %s %s %s %s %s %s\n" % (soa.ttl,
+        _absolute(soa.primary), _absolute(soa.hostmaster), soa.serial,
+        soa.refresh, soa.retry, soa.expire, soa.ttl)
+    for r in records:
+        if r.type == "SOA":
+            continue
+        yield "%s\t%s\tIN\t%s\t%s\n" % (_owner(r.name, zone_name), r.ttl,
+            r.type, _rdata(r))
+
+
+def parse(lines, origin):
+    """yield records of zone file ``lines`` with names relative to zone
+    ``origin``. The first one is DNSSOARecord of zone. Exception with
+    line number is raised on error"""
+    origin = DNSRecord.normname(origin)
+    current = origin
+    default_ttl = None
+    last_ttl = None
+    owner = None
+    soa = False
+    for (lineno, tokens, has_owner) in _entries(lines):
+        try:
+            if tokens[0].startswith("$"):
+                directive = tokens[0].upper()
+                if directive == "$ORIGIN":
+                    current = _fqdn(tokens[1], current)
+                elif directive == "$TTL":
+                    default_ttl = _ttl(tokens[1])
+                else:
+                    raise Exception("Unsupported directive: " + tokens[0])
+                continue
+            if has_owner:
+                owner = _fqdn(tokens.pop(0), current)
+            elif owner is None:
+                raise Exception("No owner name")
+            ttl = None
+            while tokens and (tokens[0][0].isdigit() or
+                    tokens[0].upper() in ("IN", "CH", "HS")):
+                token = tokens.pop(0)
+                if token[0].isdigit():
+                    ttl = _ttl(token)
+                elif token.upper() != "IN":
+                    raise Exception("Unsupported class: " + token)
+            if not tokens:
+                raise Exception("No record type")
+            if ttl is None:
+                ttl = default_ttl if default_ttl is not None else last_ttl
+            last_ttl = ttl
+            type = tokens.pop(0).upper()
+            name = _relative(owner, origin)
+            if type == "SOA":
+                if soa or name:
+                    raise Exception("SOA has to be the first record of zone")
+                if len(tokens) != 7:
+                    raise Exception("SOA needs 7 fields")
+                soa = True
+                yield DNSSOARecord(_target(tokens[0], current),
+                    _target(tokens[1], current), tokens[2],
+                    *[_ttl(t) for t in tokens[3:]])
+                continue
+            if not soa:
+                raise Exception("SOA has to be the first record of zone")
+            yield _record(name, type, ttl, tokens, current)
+        except Exception as e:
+            raise Exception("line %d: %s" % (lineno, e))
+
+
+def _entries(lines):
+    """yield (line number, tokens, owner is set) for every entry,
+    entries in parentheses are joined"""
+    tokens = []
+    depth = 0
+    for (lineno, line) in enumerate(lines, 1):
+        if not depth:
+            start = lineno
+            has_owner = bool(line) and not line[0].isspace()
+        for token in _TOKEN.findall(line):
+            if token == "(":
+                depth += 1
+            elif token == ")":
+                depth -= 1
+                if depth < 0:
+                    raise Exception("line %d: unbalanced ')'" % lineno)
+            elif not token.startswith(";"):
+                tokens.append(token)
+        if not depth and tokens:
+            yield (start, tokens, has_owner)
+            tokens = []
+    if depth:
+        raise Exception("line %d: unbalanced '('" % start)
+
+
+def _record(name, type, ttl, rdata, origin):
+    priority = None
+    if type in ("MX", "SRV"):
+        priority = rdata.pop(0)
+    if type in NAME_TYPES:
+        if not rdata:
+            raise Exception("No data of %s record" % type)
+        rdata[-1] = _target(rdata[-1], origin)
+    if type in TEXT_TYPES:
+        content = "".join(_unquote(s) for s in rdata)
+    else:
+        content = " ".join(rdata)
+    return DNSRecord(name, type, content, priority, ttl)
+
+
+def _rdata(r):
+    content = r.content
+    if r.type in NAME_TYPES:
+        fields = content.split(" ")
+        fields[-1] = _absolute(fields[-1])
+        content = " ".join(fields)
+    elif r.type in TEXT_TYPES and not content.startswith('"'):
+        content = '"%s"' % content.replace("\\", "\\\\").replace('"', '\\"')
+    if r.type in ("MX", "SRV"):
+        content = "%s %s" % (r.priority, content)
+    return content
+
+
+def _owner(name, zone_name):
+    if name == zone_name:
+        return "@"
+    if name.endswith("." + zone_name):
+        return name[:-len(zone_name) - 1]
+    return name + "."
+
+
+def _absolute(name):
+    name = str(name)
+    return name if name.endswith(".") else name + "."
+
+
+def _fqdn(name, origin):
+    """owner name, it is checked when record is created"""
+    if name == "@":
+        return origin
+    if name.endswith("."):
+        return name[:-1].lower()
+    return (name + "." + origin).lower()
+
+
+def _target(name, origin):
+    """domain name in content: absolute names are stored without dot"""
+    if name == "@":
+        return origin
+    if name.endswith("."):
+        return name[:-1]
+    return name + "." + origin
+
+
+def _relative(fqdn, origin):
+    if fqdn == origin:
+        return ""
+    if fqdn.endswith("." + origin):
+        return fqdn[:-len(origin) - 1]
+    raise Exception("Name %s is out of zone %s" % (fqdn, origin))
+
+
+def _ttl(value):
+    parts = _TTL.findall(value)
+    if "".join(n + u for (n, u) in parts) != value:
+        raise Exception("Incorrect ttl: " + value)
+    return sum(int(n) * _UNITS[u.lower()] for (n, u) in parts)
+
+
+def _unquote(s):
+    if s.startswith('"'):
+        return re.sub(r'\\(.)', r'\1', s[1:-1])
+    return s
@@ -37,6 +37,26 @@ class TestListener():
     def event(self, e):
         self.event = e
 
+class OrderListener():
+    def __init__(self):
+        self.events = []
+        self.calls = 0
+    def event(self, e):
+        self.calls += 1
+        if e["method"] == "fail":
+            raise Exception("test error")
+        if e["method"] == "flaky" and self.calls < 3:
+            raise Exception("test error")
+        self.events.append(e)
+
+class TestMessage():
+    acked = False
+    requeued = False
+    def ack(self):
+        self.acked = True
+    def requeue(self):
+        self.requeued = True
+
 class TestCase(tests.TestCase):
     run_instance_body = {
         "_context_roles": [
@@ -141,5 +161,50 @@ class TestCase(tests.TestCase):
         service.process_event(self.run_instance_body, None)
         self.assertEqual(self.run_instance_body, service.listener.event)
 
+    def test_process_message(self):
+        FLAGS.dns_listener = "tests.test_amqp.OrderListener"
+        self.stubs.Set(amqp.eventlet, "sleep", lambda t: None)
+        service = amqp.Service()
+        events = [dict(method="run_instance", args=dict(instance_uuid=uuid))
+            for uuid in ("a", "b", "a", "c", "a")]
+        for e in events:
+            service.process_message(e, TestMessage())
+        self.assertEqual(sum(q.qsize() for q in service.queues), len(events))
+        #all events of instance "a" are in one queue, in original order
+        queue = service.queues[hash("a") % len(service.queues)]
+        messages = []
+        while queue.qsize():
+            (body, message) = queue.get()
+            service.handle(body, message)
+            messages.append(message)
+        self.assertEqual([e for e in service.listener.events
+            if e["args"]["instance_uuid"] == "a"], [events[0], events[2], events[4]])
+        self.assertTrue(all(m.acked for m in messages))
+
+        #retried in place
+        self.stubs.Set(FLAGS, "dns_amqp_retries", 3)
+        sleeps = []
+        self.stubs.Set(amqp.eventlet, "sleep", sleeps.append)
+        service.listener.calls = 0
+        message = TestMessage()
+        service.handle(dict(method="flaky", args={}), message)
+        self.assertTrue(message.acked)
+        self.assertFalse(message.requeued)
+        self.assertEqual(service.listener.calls, 3)
+        self.assertEqual(sleeps, [amqp.RETRY_DELAY, amqp.RETRY_DELAY * 2])
+
+        #requeued when retries are exhausted
+        service.listener.calls = 0
+        message = TestMessage()
+        service.handle(dict(method="fail", args={}), message)
+        self.assertFalse(message.acked)
+        self.assertTrue(message.requeued)
+        self.assertEqual(service.listener.calls, 4)
+
+    def test_workers(self):
+        FLAGS.dns_listener = "tests.test_amqp.OrderListener"
+        self.stubs.Set(FLAGS, "dns_amqp_workers", 0)
+        self.assertRaises(Exception, amqp.Service)
+
     #TODO test work with actuall rabbit server - start private one for this needs
     
@@ -20,17 +20,193 @@
 import os
 import sys
 import json
+import time
 import datetime
 import unittest
 import stubout
 
+import eventlet
+
+from keystoneclient import exceptions as keystone_exceptions
+
+from nova import flags
 from nova_dns import auth 
 
+FLAGS = flags.FLAGS
+
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 import tests
 
+
+def isotime(t):
+    return time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(t))
+
+
+class TestClient(object):
+    """keystone client with tokens {token: (roles, tenant name, expires)}"""
+    tokens = {}
+
+    def __init__(self, endpoint=None, token=None):
+        self.calls = 0
+        self.tenants = TestTenants()
+
+    def get(self, url):
+        self.calls += 1
+        token = url.split("/")[-1]
+        if token not in TestClient.tokens:
+            raise keystone_exceptions.NotFound(404)
+        (roles, tenant, expires) = TestClient.tokens[token]
+        return (None, {"access": {
+            "user": {"roles": [{"name": r} for r in roles]},
+            "token": {"expires": isotime(expires),
+                "tenant": {"name": tenant} if tenant else None}}})
+
+
+class TestTenant(object):
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class TestTenants(object):
+    """keystone tenants api: known tenants, ids failing with keystone error"""
+    def __init__(self):
+        self.tenants = {"t1": "proj1"}
+        self.down = set()
+        self.calls = 0
+
+    def get(self, id):
+        self.calls += 1
+        eventlet.sleep(0.01)
+        if id in self.down:
+            raise keystone_exceptions.ClientException(500)
+        if id not in self.tenants:
+            raise keystone_exceptions.NotFound(404)
+        return TestTenant(id, self.tenants[id])
+
+    def list(self):
+        return [TestTenant(id, name) for id, name in self.tenants.items()]
+
+
+class TestRequest(object):
+    def __init__(self, token):
+        self.headers = {"X-Auth-Token": token}
+
+
 class TestCase(tests.TestCase):
-    pass
     #TODO to be done after changing auth model to acl 
+
+    def test_lru_cache(self):
+        cache = auth.LRUCache(2)
+        now = time.time()
+        cache.set("a", 1, now + 60)
+        cache.set("b", 2, now + 60)
+        self.assertEqual(cache.get("a"), 1)
+        cache.set("c", 3, now + 60)
+        #"b" is least recently used
+        self.assertEqual(cache.get("b"), None)
+        self.assertEqual(cache.get("a"), 1)
+        self.assertEqual(cache.get("c"), 3)
+        self.assertEqual(len(cache), 2)
+        cache.set("a", 1, now - 1)
+        self.assertEqual(cache.get("a"), None)
+        self.assertEqual(len(cache), 1)
+
+    def token_auth(self):
+        self.stubs.Set(auth.keystone_client, "Client", TestClient)
+        self.stubs.Set(FLAGS, "dns_auth_tenant_refresh", 0)
+        self.stubs.Set(FLAGS, "dns_auth_cache_ttl", 300)
+        return auth.TokenAuth()
+
+    def test_token_roles(self):
+        now = time.time()
+        self.stubs.Set(TestClient, "tokens", {
+            "admin": (["Admin"], "other", now + 3600),
+            "dns": ([FLAGS.dns_auth_role], "Proj", now + 3600),
+            "member": (["Member"], "proj", now + 3600),
+            "badname": ([FLAGS.dns_auth_role], "bad name", now + 3600)})
+        a = self.token_auth()
+        zone = "proj." + FLAGS.dns_zone
+        self.assertEqual(a.can(TestRequest("admin"), zone),
+            {"read": True, "write": True})
+        #tenant must match zone
+        self.assertEqual(a.can(TestRequest("dns"), zone.upper()),
+            {"read": True, "write": True})
+        self.assertEqual(a.can(TestRequest("dns"), "other." + FLAGS.dns_zone),
+            {"read": True, "write": False})
+        self.assertEqual(a.can(TestRequest("member"), zone),
+            {"read": True, "write": False})
+        #tenant name isn't zone name - no write, but token is valid
+        self.assertEqual(a.can(TestRequest("badname"), zone),
+            {"read": True, "write": False})
+        #results are cached
+        self.assertEqual(a.client.calls, 4)
+        a.can(TestRequest("dns"), zone)
+        self.assertEqual(a.client.calls, 4)
+
+    def test_token_expires(self):
+        now = time.time()
+        self.stubs.Set(TestClient, "tokens", {
+            "short": ([FLAGS.dns_auth_role], "proj", now + 10),
+            "long": ([FLAGS.dns_auth_role], "proj", now + 36000),
+            "expired": ([FLAGS.dns_auth_role], "proj", now - 10)})
+        a = self.token_auth()
+        for token in ("short", "long", "expired"):
+            a._validate(token)
+        #token expiration caps cache ttl
+        self.assertTrue(now + 9 < a.tokens.items["short"][1] < now + 11)
+        self.assertTrue(now + 299 < a.tokens.items["long"][1] < now + 301)
+        #expired token isn't trusted from cache
+        self.assertEqual(a.tokens.get("expired"), None)
+        a._validate("expired")
+        self.assertEqual(a.client.calls, 4)
+
+    def test_token_invalid(self):
+        self.stubs.Set(TestClient, "tokens", {})
+        a = self.token_auth()
+        for token in (None, "", "unknown"):
+            self.assertRaises(Exception, a.can, TestRequest(token), "zone")
+        self.assertEqual(a.client.calls, 1)
+        self.assertEqual(len(a.tokens), 0)
     
+
+    def keystone_auth(self, refresh=0):
+        self.stubs.Set(auth.keystone_client, "Client", TestClient)
+        self.stubs.Set(FLAGS, "dns_auth_tenant_refresh", refresh)
+        return auth.KeystoneAuth()
+
+    def test_tenant_refresh_lazy(self):
+        a = self.keystone_auth(refresh=300)
+        self.assertEqual(a.refresher, None)
+        self.assertEqual(a.tenant2zonename("t1"), "proj1." + FLAGS.dns_zone)
+        refresher = a.refresher
+        self.assertNotEqual(refresher, None)
+        eventlet.sleep(0)
+        self.assertEqual(a.tenants, {"t1": "proj1"})
+        a._get_tenant("t1")
+        self.assertTrue(a.refresher is refresher)
+        refresher.kill()
+
+    def test_tenant_unknown(self):
+        self.stubs.Set(FLAGS, "dns_auth_tenant_negative_size", 2)
+        a = self.keystone_auth()
+        for id in ("u1", "u2", "u3"):
+            self.assertRaises(ValueError, a._get_tenant, id)
+        self.assertEqual(len(a.unknown), 2)
+        #unknown id is remembered
+        self.assertRaises(ValueError, a._get_tenant, "u3")
+        self.assertEqual(a.client.tenants.calls, 3)
+
+    def test_tenant_keystone_error(self):
+        a = self.keystone_auth()
+        a.client.tenants.down.add("t1")
+        #all waiters of single lookup get keystone error
+        threads = [eventlet.spawn(a._get_tenant, "t1") for i in range(3)]
+        for t in threads:
+            self.assertRaises(keystone_exceptions.ClientException, t.wait)
+        self.assertEqual(a.client.tenants.calls, 1)
+        #error isn't remembered as unknown tenant
+        self.assertEqual(len(a.unknown), 0)
+        a.client.tenants.down.clear()
+        self.assertEqual(a._get_tenant("t1"), "proj1")
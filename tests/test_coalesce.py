@@ -0,0 +1,93 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova_dns.dnsmanager import DNSRecord
+from nova_dns.listener.coalesce import WriteBuffer
+
+
+class TestCase(tests.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.written = []
+        self.buffer = WriteBuffer(self.written.append, 60)
+
+    def test_add_delete(self):
+        self.buffer.put("zone", ("add", DNSRecord("host", "A", "10.0.0.1")))
+        self.buffer.put("zone", ("delete", "host", "A"))
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(self.written, [])
+        self.assertEqual(self.buffer.elided, 2)
+
+    def test_supersede(self):
+        self.buffer.put("zone", ("delete", "host", "A"))
+        self.buffer.put("zone", ("add", DNSRecord("host", "A", "10.0.0.1")))
+        self.buffer.put("zone", ("add", DNSRecord("HOST", "a", "10.0.0.2")))
+        self.buffer.put("zone", ("edit", "host", "A", "", "", 60))
+        self.buffer.put("zone2", ("add", DNSRecord("host", "A", "10.0.0.3")))
+        self.assertEqual(self.buffer.find("zone", "A", "10.0.0.2"), ["host"])
+        self.assertEqual(self.buffer.flush(), 3)
+        ops = self.written[0]
+        self.assertEqual(sorted(ops.keys()), ["zone", "zone2"])
+        self.assertEqual(ops["zone"][0], ("delete", "host", "A"))
+        self.assertEqual((ops["zone"][1][1].content, ops["zone"][1][1].ttl),
+            ("10.0.0.2", 60))
+        self.assertEqual((self.buffer.written, self.buffer.elided), (3, 2))
+        self.assertEqual(self.buffer.flush(), 0)
+        self.assertEqual(len(self.written), 1)
+
+    def test_write_failed(self):
+        def fail(ops):
+            #changes buffered while writer works
+            self.buffer.put("zone", ("add", DNSRecord("host", "A",
+                "10.0.0.3")))
+            self.buffer.put("zone", ("add", DNSRecord("host3", "A",
+                "10.0.0.4")))
+            raise Exception("test error")
+        self.buffer.put("zone", ("delete", "host", "A"))
+        self.buffer.put("zone", ("add", DNSRecord("host", "A", "10.0.0.1")))
+        self.buffer.put("zone", ("add", DNSRecord("host2", "A", "10.0.0.2")))
+        self.buffer.writer = fail
+        self.assertRaises(Exception, self.buffer.flush)
+        self.assertEqual((self.buffer.written, self.buffer.elided), (0, 0))
+        self.buffer.writer = self.written.append
+        self.assertEqual(self.buffer.flush(), 4)
+        ops = self.written[0]["zone"]
+        self.assertEqual(ops[0], ("delete", "host", "A"))
+        self.assertEqual([(op[1].name, op[1].content) for op in ops[1:]],
+            [("host", "10.0.0.3"), ("host2", "10.0.0.2"),
+            ("host3", "10.0.0.4")])
+        self.assertEqual((self.buffer.written, self.buffer.elided), (4, 1))
+
+    def test_no_window(self):
+        buffer = WriteBuffer(self.written.append, 0)
+        buffer.start()
+        buffer.put("zone", ("delete", "host", "A"))
+        buffer.put("zone", ("delete", "host2", "A"))
+        self.assertEqual(buffer.thread, None)
+        self.assertEqual(self.written, [])
+        buffer.flush()
+        self.assertEqual(self.written, [{"zone": [("delete", "host", "A"),
+            ("delete", "host2", "A")]}])
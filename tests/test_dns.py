@@ -20,12 +20,18 @@
 import os
 import sys
 import json
+import time
 import unittest
 
+import eventlet
+
 import webob
 import urllib
 
 from nova_dns import dns 
+from nova_dns import metrics
+from nova_dns.dnsmanager import SERIALS
+from nova_dns.dnsmanager import memory
 
 from nova import flags
 FLAGS = flags.FLAGS
@@ -36,9 +42,11 @@ import tests
 zones = ['test']
 soa =   dict(retry="1", primary="ns.localhost", refresh="3", expire="4", ttl="5", 
     hostmaster="me@localhost", serial="5")
-add =   dict(content="1", ttl=2, priority=3)
+add =   dict(content="10.0.0.1", ttl=2, priority=3)
 
 class TestManager():
+    released = 0
+
     def list(self):
         return zones
 
@@ -53,14 +61,21 @@ class TestManager():
     def get(self, zone_name):
         return TestZone(zone_name)
 
+    def release(self):
+        TestManager.released += 1
+
 
 class TestZone():
+    serial = "5"
+    pages = 0
     def __init__(self, zone_name):
         self.zone_name = zone_name
     def drop(self):
         pass
+    def get_serial(self):
+        return TestZone.serial
     def add(self, v):
-        return [self.zone_name, v.__dict__]
+        return [self.zone_name, v.to_dict()]
     def get(self, name, type=None):
         self.name = name
         self.type = type 
@@ -69,6 +84,23 @@ class TestZone():
         return [self.zone_name, name, type, content, priority, ttl] 
     def delete(self, name, type):
         return [self.zone_name, name, type] 
+    def page(self, name=None, type=None, limit=None, marker=None):
+        TestZone.pages += 1
+        self.get(name, type)
+        return ([self], "%s-%s" % (marker, limit))
+    def iter(self, name=None, type=None):
+        self.get(name, type)
+        return iter([self] * 3)
+    def to_dict(self):
+        #zone is its own record in replies
+        return dict(zone_name=self.zone_name, name=self.name, type=self.type)
+    def batch(self, ops):
+        return [[self.zone_name, op[0]] for op in ops]
+    def changes(self, since):
+        if since == int(TestZone.serial):
+            return (since, [])
+        return (int(TestZone.serial), [{"action": "add", "serial":
+            int(TestZone.serial), "record": {"name": self.zone_name}}])
 
 class TestAuth():
     read = False
@@ -77,12 +109,15 @@ class TestAuth():
         return {"read": self.read, "write": self.write}
 
 class TestCase(tests.TestCase):
-    def req(self, path, status=200, error=None, method='GET', params=None):
+    def req(self, path, status=200, error=None, method='GET', params=None,
+            body=None):
         #FIXME - hardcoded api-paste chain
         query = "%s?%s" % (path, urllib.urlencode(params)) if params else path
         print query
         request = webob.Request.blank(query)
         request.method = method
+        if body is not None:
+            request.body = json.dumps(body)
         res = request.get_response(dns.VersionFilter(dns.App()))
         self.assertEqual(res.status_int, status, "path %s: status %d != %d" % 
             (path, res.status_int, status))
@@ -142,4 +177,184 @@ class TestCase(tests.TestCase):
         self.assertEqual(self.req('/record/testzone/some/MX', method='DELETE'),
             ['testzone', 'some', 'MX'])
 
+    def test_list(self):
+        FLAGS.dns_manager = "tests.test_dns.TestManager"
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = True
+        self.assertEqual(self.req('/record/testzone',
+            params={'type': 'A', 'limit': 1, 'marker': 5}),
+            dict(records=[dict(zone_name='testzone', type='A', name=None)],
+                marker='5-1'))
+        for limit in ('0', '-1', 'x', '\xd9\xa1x'):
+            self.req('/record/testzone', params={'limit': limit},
+                error='Incorrect limit: ' + limit.decode('utf-8'))
+        for marker in ('-1', 'x'):
+            self.req('/record/testzone', params={'limit': 1,
+                'marker': marker}, error='Incorrect marker: ' + marker)
+        self.assertEqual(self.req('/record/testzone',
+            params={'name': '@', 'stream': 1}),
+            [dict(zone_name='testzone', type=None, name='')] * 3)
+
+    def test_stream_release(self):
+        FLAGS.dns_manager = "tests.test_dns.TestManager"
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = True
+        self.stubs.Set(TestManager, "released", 0)
+        #client is gone before the first chunk: server only closes reply
+        request = webob.Request.blank('/record/testzone?stream=1')
+        app_iter = dns.App()(request.environ,
+            lambda status, headers, exc_info=None: None)
+        self.assertEqual(TestManager.released, 0)
+        app_iter.close()
+        self.assertEqual(TestManager.released, 1)
+
+    def test_record_edit(self):
+        self.stubs.Set(FLAGS, "dns_manager",
+            "nova_dns.dnsmanager.memory.Manager")
+        self.stubs.Set(memory, "ZONES", {})
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = AUTH.write = True
+        self.req('/zone/example.com', method='PUT')
+        self.req('/record/example.com/www/A/10.0.0.1', method='PUT')
+        self.req('/record/example.com/www/A', method='POST',
+            params={"content": "garbage"},
+            error='Incorrect A record content: garbage')
+        self.req('/record/example.com/www/A', method='POST',
+            params={"content": u"10.0.0.\u0661".encode("utf-8")},
+            error=u'Incorrect A record content: 10.0.0.\u0661')
+        self.assertEqual([r["content"] for r in
+            self.req('/record/example.com', params={"type": "A"})],
+            ["10.0.0.1"])
+
+    def test_batch(self):
+        FLAGS.dns_manager = "tests.test_dns.TestManager"
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = True
+        body = {"testzone": [
+            dict(action="add", name="@", type="A", content="10.0.0.1"),
+            dict(action="delete", name="some", type="INCORRECT"),
+            dict(action="edit", name="some", type="MX", content="2"),
+            dict(action="edit", name="www", type="A", content="garbage"),
+            dict(action="edit", name="www", type="A",
+                content=u"10.0.0.\u0661"),
+            dict(action="incorrect")]}
+
+        AUTH.write = False
+        self.assertEqual(self.req('/record/', method='POST', body=body),
+            {"testzone": [dict(result=None, error='unauthorized')] * 6})
+
+        AUTH.write = True
+        self.assertEqual(self.req('/record/', method='POST', body=body),
+            {"testzone": [
+                dict(result=['testzone', 'add'], error=None),
+                dict(result=None, error='Incorrect type: INCORRECT'),
+                dict(result=['testzone', 'edit'], error=None),
+                dict(result=None,
+                    error='Incorrect A record content: garbage'),
+                dict(result=None,
+                    error=u'Incorrect A record content: 10.0.0.\u0661'),
+                dict(result=None, error='Incorrect action: incorrect')]})
+
+    def test_metrics(self):
+        FLAGS.dns_manager = "tests.test_dns.TestManager"
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = True
+        self.stubs.Set(metrics, "METRICS", metrics.Metrics())
+        self.req('/zone/')
+        self.req('/zone/error', method='PUT', error="unauthorized")
+        metrics.METRICS.gauge("test_gauge", lambda: {"a": 1})
+        AUTH.read = False
+        self.req('/metrics', error="unauthorized")
+        self.stubs.Set(FLAGS, "dns_metrics_public", True)
+        request = webob.Request.blank('/metrics')
+        res = request.get_response(dns.VersionFilter(dns.App()))
+        self.assertEqual(res.content_type, "text/plain")
+        lines = res.body.splitlines()
+        self.assertTrue('nova_dns_api_request_seconds_count{action="index"} 1'
+            in lines)
+        self.assertTrue('nova_dns_api_errors_total{action="zone_add"} 1'
+            in lines)
+        self.assertTrue('test_gauge{state="a"} 1' in lines)
+
+    def test_conditional(self):
+        FLAGS.dns_manager = "tests.test_dns.TestManager"
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = True
+        self.stubs.Set(TestZone, "serial", "7")
+        self.stubs.Set(TestZone, "pages", 0)
+        app = dns.VersionFilter(dns.App())
+
+        def get(path, etag=None):
+            request = webob.Request.blank(path)
+            if etag:
+                request.headers["If-None-Match"] = etag
+            return request.get_response(app)
+
+        res = get('/record/testzone?limit=1')
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers["ETag"], '"7"')
+        self.assertEqual(get('/record/testzone?limit=1', '"7"').status_int, 304)
+        self.assertEqual(get('/record/testzone?limit=1', 'W/"7"').status_int,
+            304)
+        #the same serial and query - reply is taken from cache
+        self.assertEqual(get('/record/testzone?limit=1').body, res.body)
+        self.assertEqual(TestZone.pages, 1)
+
+        TestZone.serial = "8"
+        res = get('/record/testzone?limit=1', '"7"')
+        self.assertEqual(res.status_int, 200)
+        self.assertEqual(res.headers["ETag"], '"8"')
+        self.assertEqual(TestZone.pages, 2)
+
+        res = get('/zone/')
+        self.assertEqual(get('/zone/', res.headers["ETag"]).status_int, 304)
+
+    def test_reply_cache(self):
+        cache = dns.ReplyCache(10, 10)
+        cache.set("a", "1234", float("inf"))
+        cache.set("b", "1234", float("inf"))
+        self.assertEqual(cache.get("a"), "1234")
+        #total size limit evicts least recently used
+        cache.set("c", "1234", float("inf"))
+        self.assertEqual((cache.get("b"), len(cache), cache.bytes),
+            (None, 2, 8))
+        cache.set("c", "12", float("inf"))
+        self.assertEqual(cache.bytes, 6)
+        #too big body isn't cached
+        cache.set("d", "12345678901", float("inf"))
+        self.assertEqual((cache.get("d"), len(cache), cache.bytes),
+            (None, 2, 6))
+        cache.set("e", "12", time.time() - 1)
+        self.assertEqual(cache.get("e"), None)
+        self.assertEqual(cache.bytes, 6)
+
+    def test_changes(self):
+        FLAGS.dns_manager = "tests.test_dns.TestManager"
+        AUTH = TestAuth()
+        dns.AUTH = AUTH
+        AUTH.read = True
+        self.stubs.Set(TestZone, "serial", "7")
+        self.req('/zone/testzone/changes', error='since is required')
+        self.assertEqual(self.req('/zone/testzone/changes',
+            params={'since': 7}), {"serial": 7, "reset": False, "changes": []})
+
+        #local change wakes up waiting request before next serial check
+        self.stubs.Set(FLAGS, "dns_changes_poll_interval", 10)
 
+        def change():
+            eventlet.sleep(0.2)
+            TestZone.serial = "8"
+            SERIALS.invalidate("testzone")
+        eventlet.spawn(change)
+        start = time.time()
+        result = self.req('/zone/testzone/changes',
+            params={'since': 7, 'wait': 5})
+        self.assertTrue(time.time() - start < 2)
+        self.assertEqual(result["serial"], 8)
+        self.assertEqual(result["changes"][0]["record"]["name"], "testzone")
@@ -0,0 +1,144 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova import flags
+from nova_dns import auth
+from nova_dns.dnsmanager import DNSRecord
+from nova_dns.dnsmanager import memory
+from nova_dns.listener import simple
+
+FLAGS = flags.FLAGS
+
+#(id, uuid, hostname, vm_state, deleted, fixed ip, fixed ip deleted)
+INSTANCES = [
+    (1, "u1", "missing", "active", 0, "10.0.0.1", 0),
+    (2, "u2", "changed", "active", 0, "10.0.0.2", 0),
+    (3, "u3", "same", "active", 0, "10.0.0.3", 0),
+    (4, "u4", "stale", "deleted", 1, "10.0.0.4", 0),
+    (5, "u5", "building", "building", 0, "10.0.0.5", 1),
+]
+
+
+class TestCase(tests.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        for (flag, value) in (("dns_manager",
+                "nova_dns.dnsmanager.memory.Manager"),
+                ("sql_connection", "sqlite://"), ("dns_reconcile", False),
+                ("dns_coalesce_window", 0), ("dns_ptr", False),
+                ("dns_ipv6", False), ("dns_floating_zone", ""),
+                ("dns_reconcile_delete", False), ("dns_db_threadpool", False)):
+            self.stubs.Set(FLAGS, flag, value)
+        self.stubs.Set(memory, "ZONES", {})
+        self.stubs.Set(simple, "AUTH", auth.NoAuth())
+        self.listener = simple.Listener()
+        conn = self.listener.conn
+        conn.execute("""create table instances (id integer primary key,
+            uuid varchar(36), hostname varchar(255), project_id varchar(255),
+            vm_state varchar(255), deleted integer)""")
+        conn.execute("""create table fixed_ips (id integer primary key,
+            address varchar(255), instance_id integer, deleted integer)""")
+        for (id, uuid, hostname, vm_state, deleted, address, f_deleted) in \
+                INSTANCES:
+            conn.execute("insert into instances values (?, ?, ?, ?, ?, ?)",
+                (id, uuid, hostname, "proj", vm_state, deleted))
+            conn.execute("insert into fixed_ips (address, instance_id, "
+                "deleted) values (?, ?, ?)", (address, id, f_deleted))
+        self.zone_name = "proj." + FLAGS.dns_zone
+        self.listener.dnsmanager.add(self.zone_name)
+        self.zone = self.listener.dnsmanager.get(self.zone_name)
+        self.zone.add_many([DNSRecord("changed", "A", "10.0.0.20"),
+            DNSRecord("same", "A", "10.0.0.3"),
+            DNSRecord("stale", "A", "10.0.0.4")])
+
+    def tearDown(self):
+        self.listener.stop()
+        super(TestCase, self).tearDown()
+
+    def records(self):
+        return sorted((r.name, r.content) for r in self.zone.get(type="A"))
+
+    def test_reconcile(self):
+        self.listener.reconcile()
+        self.assertEqual(self.records(), [
+            ("changed." + self.zone_name, "10.0.0.2"),
+            ("missing." + self.zone_name, "10.0.0.1"),
+            ("same." + self.zone_name, "10.0.0.3"),
+            ("stale." + self.zone_name, "10.0.0.4")])
+        #building instance without (not deleted) fixed ip waits for it
+        self.assertEqual(self.listener.pending.keys(), ["u5"])
+        self.assertTrue(FLAGS.dns_zone in self.listener.dnsmanager.list())
+
+    def test_reconcile_delete(self):
+        FLAGS.dns_reconcile_delete = True
+        #records added by users aren't named after instances
+        self.zone.add(DNSRecord("", "A", "10.0.0.100"))
+        self.zone.add(DNSRecord("www", "A", "10.0.0.101"))
+        self.listener.reconcile()
+        self.assertEqual(self.records(), [
+            ("changed." + self.zone_name, "10.0.0.2"),
+            ("missing." + self.zone_name, "10.0.0.1"),
+            (self.zone_name, "10.0.0.100"),
+            ("same." + self.zone_name, "10.0.0.3"),
+            ("www." + self.zone_name, "10.0.0.101")])
+        #nothing to change next time
+        serial = self.zone.get_serial()
+        self.listener.reconcile()
+        self.assertEqual(self.zone.get_serial(), serial)
+
+    def test_reconcile_delete_ptr(self):
+        FLAGS.dns_reconcile_delete = True
+        FLAGS.dns_ptr = True
+        self.listener.reconcile()
+        (ptr_zone_name, name) = self.listener.ip2zone("10.0.0.1")
+        zone = self.listener.dnsmanager.get(ptr_zone_name)
+        zone.add_many([DNSRecord("200", "PTR", "www." + self.zone_name),
+            DNSRecord("4", "PTR", "stale." + self.zone_name)])
+        self.listener.reconcile()
+        self.assertEqual(sorted(r.content for r in zone.get(type="PTR")),
+            ["changed." + self.zone_name, "missing." + self.zone_name,
+            "same." + self.zone_name, "www." + self.zone_name])
+
+    def test_floating(self):
+        FLAGS.dns_floating_zone = "float." + FLAGS.dns_zone
+        self.listener.dnsmanager.add(FLAGS.dns_floating_zone)
+        zone = self.listener.dnsmanager.get(FLAGS.dns_floating_zone)
+        event = {"method": "associate_floating_ip",
+            "args": {"floating_address": "172.16.0.1",
+            "fixed_address": "10.0.0.1"}}
+        self.listener.event(event)
+        self.assertEqual([r.name for r in zone.find("A", "172.16.0.1")],
+            ["missing.proj." + FLAGS.dns_floating_zone])
+        #floating ip moved to another instance
+        event["args"]["fixed_address"] = "10.0.0.3"
+        self.listener.event(event)
+        self.assertEqual([r.name for r in zone.find("A", "172.16.0.1")],
+            ["same.proj." + FLAGS.dns_floating_zone])
+
+    def test_pending_instances(self):
+        rows = self.listener._pending_instances(["u1", "u4", "u5"])
+        self.assertEqual([(r.uuid, r.address) for r in rows],
+            [("u1", "10.0.0.1")])
@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova_dns.dnsmanager import DNSRecord
+from nova_dns.dnsmanager import memory
+
+
+class TestCase(tests.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.stubs.Set(memory, "ZONES", {})
+        self.now = 1000
+        self.stubs.Set(time, "time", lambda: self.now)
+        self.manager = memory.Manager()
+        self.manager.add("example.com")
+        self.zone = self.manager.get("example.com")
+
+    def test_zone(self):
+        self.assertRaises(Exception, self.manager.add, "example.com")
+        self.manager.add("sub.example.com")
+        self.manager.add("xexample.com")
+        self.assertRaises(Exception, self.manager.drop, "example.com")
+        self.manager.drop("example.com", force=True)
+        self.assertEqual(self.manager.list(), ["xexample.com"])
+        self.assertRaises(Exception, self.manager.get, "example.com")
+
+    def test_records(self):
+        self.zone.add(DNSRecord("www", "A", "10.0.0.2"))
+        self.zone.add(DNSRecord("www2", "A", "10.0.0.1"))
+        self.zone.add(DNSRecord("", "MX", "mail", priority=10))
+        self.assertEqual([r.content for r in self.zone.get("www", "a")],
+            ["10.0.0.2"])
+        self.assertEqual(self.zone.get("www")[0].name, "www.example.com")
+        self.assertEqual([r.name for r in self.zone.find("A", "10.0.0.2")],
+            ["www.example.com"])
+        self.assertEqual(len(self.zone.get()), 4)
+        #three changes in the same second
+        self.assertEqual(self.zone.get_serial(), "1003")
+        self.now = 1001
+        self.zone.set("", "MX", priority=20)
+        self.assertEqual(self.zone.get("", "MX")[0].priority, 20)
+        self.assertEqual(self.zone.get_soa().serial, "1004")
+        self.now = 2000
+        self.zone.add(DNSRecord("www3", "A", "10.0.0.3"))
+        self.assertEqual(self.zone.get_serial(), "2000")
+        self.assertRaises(Exception, self.zone.set, "", "SOA", "x")
+        #edited content is validated like added one
+        self.assertRaises(ValueError, self.zone.set, "www2", "A", "garbage")
+        self.assertEqual(self.zone.get("www2")[0].content, "10.0.0.1")
+        self.assertEqual(self.zone.get_serial(), "2000")
+        self.zone.delete("www", "A")
+        self.assertEqual(self.zone.get("www"), [])
+        self.assertRaises(Exception, self.zone.delete, "www", "A")
+        self.assertEqual([(z, r.content) for (z, r) in
+            self.manager.dump(["MX"])], [("example.com", "mail")])
+
+    def test_duplicates(self):
+        self.zone.add(DNSRecord("www", "A", "10.0.0.1"))
+        serial = self.zone.get_serial()
+        self.assertRaises(Exception, self.zone.add,
+            DNSRecord("WWW", "a", "10.0.0.2"))
+        #nothing is added if one of records exists
+        self.assertRaises(Exception, self.zone.add_many,
+            [DNSRecord("new", "A", "10.0.0.3"), DNSRecord("www", "A",
+            "10.0.0.2")])
+        self.assertRaises(Exception, self.zone.add_many,
+            [DNSRecord("new", "A", "10.0.0.3"), DNSRecord("new", "A",
+            "10.0.0.4")])
+        self.assertEqual(self.zone.get("new"), [])
+        self.assertEqual([r.content for r in self.zone.get("www")],
+            ["10.0.0.1"])
+        self.assertEqual(self.zone.get_serial(), serial)
+
+    def test_batch(self):
+        self.zone.add(DNSRecord("old", "A", "10.0.0.1"))
+        self.now = 1002
+        res = self.zone.batch([("add", DNSRecord("a", "A", "10.0.0.2")),
+            ("add", DNSRecord("old", "A", "10.0.0.3")),
+            ("edit", "old", "A", "10.0.0.4", "", ""),
+            ("delete", "missing", "A")])
+        self.assertEqual([isinstance(r, Exception) for r in res],
+            [False, True, False, True])
+        self.assertEqual(self.zone.get("old")[0].content, "10.0.0.4")
+        self.assertEqual(self.zone.get_soa().serial, "1002")
+        self.now = 1003
+        self.zone.batch([("delete", "missing", "A")])
+        self.assertEqual(self.zone.get_soa().serial, "1002")
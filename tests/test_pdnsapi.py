@@ -0,0 +1,191 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import json
+import threading
+import urlparse
+import BaseHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova import flags
+from nova_dns.dnsmanager import DNSRecord
+from nova_dns.dnsmanager import pdnsapi
+
+FLAGS = flags.FLAGS
+
+PREFIX = "/api/v1/servers/localhost/zones"
+SEARCH = "/api/v1/servers/localhost/search-data"
+
+
+class StubHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """minimal PowerDNS API: zones, rrset filters, search and RRset PATCH"""
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, status, data=None):
+        body = json.dumps(data) if data is not None else ""
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle_one(self):
+        server = self.server
+        server.requests.append((self.command, self.path))
+        if self.headers.get("X-API-Key") != "secret":
+            return self.reply(401, {"error": "Unauthorized"})
+        length = int(self.headers.get("Content-Length") or 0)
+        data = json.loads(self.rfile.read(length)) if length else None
+        path = self.path.split("?")[0]
+        query = urlparse.parse_qs(urlparse.urlsplit(self.path).query)
+        if path == SEARCH:
+            q = query["q"][0]
+            return self.reply(200, [{"object_type": "record",
+                "zone": z["name"], "name": r["name"], "type": r["type"],
+                "ttl": r["ttl"], "content": rec["content"]}
+                for z in server.zones.values() for r in z["rrsets"]
+                for rec in r["records"] if rec["content"] == q])
+        if path == PREFIX:
+            if self.command == "GET":
+                return self.reply(200, [{"id": z["name"], "name": z["name"]}
+                    for z in server.zones.values()])
+            if data["name"] in server.zones:
+                return self.reply(409, {"error": "Conflict"})
+            server.zones[data["name"]] = {"name": data["name"],
+                "rrsets": data["rrsets"]}
+            return self.reply(201, server.zones[data["name"]])
+        zone = server.zones.get(path[len(PREFIX) + 1:].replace("%2F", "/"))
+        if zone is None:
+            return self.reply(404, {"error": "Not Found"})
+        if self.command == "GET":
+            return self.reply(200, dict(zone, rrsets=[r for r in zone["rrsets"]
+                if r["name"] == query.get("rrset_name", [r["name"]])[0] and
+                r["type"] == query.get("rrset_type", [r["type"]])[0]]))
+        if self.command == "DELETE":
+            del server.zones[zone["name"]]
+            return self.reply(204)
+        for change in data["rrsets"]:
+            key = (change["name"], change["type"])
+            zone["rrsets"] = [r for r in zone["rrsets"]
+                if (r["name"], r["type"]) != key]
+            if change["changetype"] == "REPLACE":
+                del change["changetype"]
+                zone["rrsets"].append(change)
+        return self.reply(204)
+
+    do_GET = do_POST = do_PATCH = do_DELETE = handle_one
+
+
+class TestCase(tests.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), StubHandler)
+        self.server.zones = {}
+        self.server.requests = []
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.stubs.Set(FLAGS, "dns_api_url",
+            "http://127.0.0.1:%d" % self.server.server_port)
+        self.stubs.Set(FLAGS, "dns_api_key", "secret")
+        self.stubs.Set(pdnsapi, "_POOL", None)
+        self.manager = pdnsapi.Manager()
+
+    def tearDown(self):
+        pdnsapi.get_pool().close()
+        self.server.shutdown()
+        self.server.server_close()
+        super(TestCase, self).tearDown()
+
+    def test_zone(self):
+        self.assertEqual(self.manager.add("example.com"), "ok")
+        self.manager.add("sub.example.com")
+        self.assertEqual(sorted(self.manager.list()),
+            ["example.com", "sub.example.com"])
+        zone = self.manager.get("example.com")
+        self.assertEqual(zone.get_soa().primary, "ns1")
+        self.assertRaises(Exception, self.manager.add, "example.com")
+        self.assertRaises(Exception, self.manager.get, "example.org")
+        self.assertRaises(Exception, self.manager.drop, "example.com")
+        self.manager.drop("example.com", force=True)
+        self.assertEqual(self.manager.list(), [])
+
+    def test_records(self):
+        self.manager.add("example.com")
+        zone = self.manager.get("example.com")
+        del self.server.requests[:]
+        zone.add(DNSRecord("www", "A", "10.0.0.2", ttl=60))
+        #only added rrset is read
+        self.assertEqual([urlparse.parse_qs(urlparse.urlsplit(path).query)
+            for (m, path) in self.server.requests if m == "GET"],
+            [{"rrset_name": ["www.example.com."], "rrset_type": ["A"]}])
+        #existing name and type, like unique index of SQL backend
+        self.assertRaises(Exception, zone.add,
+            DNSRecord("www", "A", "10.0.0.1"))
+        self.assertEqual(zone.batch([("add", DNSRecord("www", "A",
+            "10.0.0.1"))])[0].__class__, Exception)
+        zone.add(DNSRecord("", "MX", "mail.example.com", priority=10))
+        self.assertEqual([(r.content, r.ttl) for r in zone.get("www", "A")],
+            [("10.0.0.2", 60)])
+        mx = zone.get("", "MX")[0]
+        self.assertEqual((mx.content, mx.priority),
+            ("mail.example.com", 10))
+        zone.set("", "MX", priority=20)
+        self.assertEqual(zone.get("", "MX")[0].priority, 20)
+        self.assertRaises(ValueError, zone.set, "www", "A", "garbage")
+        self.assertEqual(zone.get("www", "A")[0].content, "10.0.0.2")
+        self.assertEqual([r.name for r in zone.find("A", "10.0.0.2")],
+            ["www.example.com"])
+        self.assertEqual(zone.find("A", "10.0.0.3"), [])
+        zone.delete("www", "A")
+        self.assertEqual(zone.get("www"), [])
+        self.assertRaises(Exception, zone.delete, "www", "A")
+
+    def test_batch(self):
+        self.manager.add("example.com")
+        zone = self.manager.get("example.com")
+        zone.add(DNSRecord("old", "A", "10.0.0.1"))
+        del self.server.requests[:]
+        res = zone.batch([("add", DNSRecord("a", "A", "10.0.0.2")),
+            ("add", DNSRecord("old", "A", "10.0.0.3")),
+            ("edit", "old", "A", "10.0.0.4", "", ""),
+            ("delete", "missing", "A"),
+            ("add", DNSRecord("b", "PTR", "a.example.com"))])
+        self.assertEqual(res[0], "ok")
+        self.assertTrue(isinstance(res[1], Exception))
+        self.assertEqual(res[2], "ok")
+        self.assertTrue(isinstance(res[3], Exception))
+        #one read and one PATCH for the whole batch
+        self.assertEqual([m for (m, path) in self.server.requests],
+            ["GET", "PATCH"])
+        self.assertEqual(zone.get("old")[0].content, "10.0.0.4")
+        self.assertEqual(zone.get("b", "PTR")[0].content, "a.example.com")
+        self.assertEqual(sorted((z, r.name) for (z, r) in
+            self.manager.dump(["A"])),
+            [("example.com", "a.example.com"),
+            ("example.com", "old.example.com")])
+        #all requests went through one keep-alive connection
+        self.assertEqual(pdnsapi.get_pool().created, 1)
@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import tempfile
+import time
+
+from sqlalchemy import event
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova import flags
+
+FLAGS = flags.FLAGS
+#tables are created on import of powerdns backend
+FLAGS.dns_sql_connection = "sqlite:///%s/pdns.db" % tempfile.mkdtemp()
+
+from nova_dns.dnsmanager import DNSRecord, SERIALS
+from nova_dns.dnsmanager import powerdns
+from nova_dns.dnsmanager.powerdns import models
+from nova_dns.dnsmanager.powerdns import session
+
+
+class TestCase(tests.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.engine = session.get_engine()
+        for model in (models.Records, models.RecordChanges,
+                models.DomainLabels, models.Domains):
+            self.engine.execute(model.__table__.delete())
+        self.stubs.Set(powerdns, "DOMAINS", powerdns.DomainCache())
+        self.stubs.Set(powerdns, "INDEXED", [time.time()])
+        self.manager = powerdns.Manager()
+
+    def tearDown(self):
+        self.manager.release()
+        super(TestCase, self).tearDown()
+
+    def test_drop(self):
+        for zone in ("example.com", "sub.example.com", "xexample.com"):
+            self.manager.add(zone)
+        self.manager.get("sub.example.com").add(
+            DNSRecord("www", "A", "10.0.0.1"))
+        self.assertRaises(Exception, self.manager.drop, "example.com")
+        self.manager.drop("example.com", force=True)
+        self.assertEqual(self.manager.list(), ["xexample.com"])
+        self.assertEqual([r.type for r in
+            self.manager.get("xexample.com").get()], ["SOA"])
+        self.assertEqual(self.engine.execute(
+            "select count(*) from records").scalar(), 1)
+
+    def test_drop_not_indexed(self):
+        self.manager.add("example.com")
+        #zones added by other tool after start
+        for (id, name) in ((100, "other.org"), (101, "sub.other.org"),
+                (102, "xother.org")):
+            self.engine.execute("insert into domains (id, name) values "
+                "(?, ?)", (id, name))
+        self.assertRaises(Exception, self.manager.drop, "other.org")
+        self.manager.drop("other.org", force=True)
+        self.assertEqual(sorted(self.manager.list()),
+            ["example.com", "xother.org"])
+
+    def test_drop_statements(self):
+        self.manager.add("example.com")
+        self.manager.add("sub.example.com")
+        #many unrelated indexed zones
+        self.engine.execute(models.Domains.__table__.insert(),
+            [dict(id=i, name="zone%d.org" % i) for i in xrange(1000, 3000)])
+        self.engine.execute(models.DomainLabels.__table__.insert(),
+            [dict(domain_id=i, rname="org.zone%d." % i)
+                for i in xrange(1000, 3000)])
+        statements = []
+        counting = [True]
+
+        def count(conn, cursor, statement, *args):
+            #listener can't be removed in sqlalchemy 0.7
+            if counting[0]:
+                statements.append(statement)
+        event.listen(self.engine, "before_cursor_execute", count)
+        try:
+            self.manager.drop("example.com", force=True)
+        finally:
+            counting[0] = False
+        #range of labels index and one delete per table
+        self.assertEqual(len(statements), 5)
+        self.assertFalse([s for s in statements if "LIKE" in s.upper()])
+        self.assertEqual(len(self.manager.list()), 2000)
+
+        #zones of other tools are labelled once per dns_zone_cache_ttl
+        self.engine.execute("insert into domains (id, name) values "
+            "(5000, 'other.org')")
+        self.engine.execute("insert into domains (id, name) values "
+            "(5001, 'sub.other.org')")
+        self.stubs.Set(powerdns, "INDEXED", [0])
+        self.assertRaises(Exception, self.manager.drop, "other.org")
+
+    def test_transaction(self):
+        self.manager.add("example.com")
+        zone = self.manager.get("example.com")
+        zone.add(DNSRecord("www", "A", "10.0.0.1"))
+        serial = zone.get_serial()
+        (since, changes) = zone.changes(serial)
+
+        def fail(serial, change_date):
+            raise Exception("test error")
+        self.stubs.Set(zone, "_write_journal", fail)
+        #record, serial and journal are written together or not at all
+        generation = SERIALS.generation("example.com")
+        self.assertRaises(Exception, zone.add, DNSRecord("a", "A",
+            "10.0.0.2"))
+        self.assertRaises(Exception, zone.set, "www", "A", "10.0.0.3")
+        self.assertRaises(Exception, zone.delete, "www", "A")
+        self.stubs.UnsetAll()
+        self.assertEqual(zone.get("a"), [])
+        self.assertEqual([r.content for r in zone.get("www")], ["10.0.0.1"])
+        self.assertEqual(zone.get_serial(), serial)
+        self.assertEqual(SERIALS.generation("example.com"), generation)
+        self.assertRaises(Exception, zone.delete, "missing", "A")
+        self.assertRaises(ValueError, zone.set, "www", "A", "garbage")
+        self.assertEqual([r.content for r in zone.get("www")], ["10.0.0.1"])
+        self.assertEqual(zone.get_serial(), serial)
+
+        zone.delete("www", "A")
+        #cached serial is dropped after commit
+        self.assertEqual(SERIALS.generation("example.com"), generation + 1)
+        (new_serial, changes) = zone.changes(serial)
+        self.assertTrue(int(new_serial) > int(serial))
+        self.assertEqual([(c["action"], c["record"]["content"])
+            for c in changes], [("delete", "10.0.0.1")])
+
+    def test_big_batch(self):
+        self.manager.add("example.com")
+        zone = self.manager.get("example.com")
+        zone.add(DNSRecord("host0", "A", "10.0.0.1"))
+        params = []
+        counting = [True]
+
+        def count(conn, cursor, statement, parameters, *args):
+            if counting[0] and statement.startswith("SELECT"):
+                params.append(len(parameters))
+        event.listen(self.engine, "before_cursor_execute", count)
+        #more names than bound parameters allowed by old sqlite (999)
+        try:
+            res = zone.batch([("add", DNSRecord("host%d" % i, "A",
+                "10.0.0.1")) for i in xrange(1200)])
+        finally:
+            counting[0] = False
+        self.assertTrue(isinstance(res[0], Exception))
+        self.assertEqual(res[1:], ["ok"] * 1199)
+        self.assertEqual(len(zone.get(type="A")), 1200)
+        #existing records are looked up by chunks of names
+        self.assertTrue(max(params) < 999)
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova_dns.dnsmanager import DNSRecord, DNSSOARecord
+
+
+class TestCase(tests.TestCase):
+    def test_content(self):
+        for (type, content) in (("A", "10.0.0.1"), ("AAAA", "fe80::1"),
+                ("MX", "mail.example.com"), ("CNAME", "www.example.com."),
+                ("PTR", "host"), ("SRV", "20 5060 sip.example.com"),
+                ("TXT", "any text")):
+            self.assertEqual(DNSRecord("", type, content).content, content)
+        for (type, content) in (("A", "1"), ("A", "10.0.0.256"),
+                ("AAAA", "10.0.0.1"), ("MX", "mail example"),
+                ("CNAME", ""), ("SRV", "20 sip.example.com")):
+            self.assertRaises(ValueError, DNSRecord, "", type, content)
+        #non-ascii content is rejected by validated types only
+        self.assertRaises(ValueError, DNSRecord, "", "A", u"10.0.0.\u0661")
+        self.assertRaises(ValueError, DNSRecord.normcontent, "CNAME",
+            u"\u043f\u0440\u0438\u043c\u0435\u0440.com")
+        self.assertEqual(DNSRecord("", "TXT", u"\u0442\u0435\u043a\u0441\u0442").content,
+            u"\u0442\u0435\u043a\u0441\u0442")
+
+    def test_from_db(self):
+        r = DNSRecord.from_db(u"www.example.com", u"A", u"10.0.0.1", None,
+            None)
+        self.assertEqual(r.to_dict(), {"name": "www.example.com", "type": "A",
+            "content": "10.0.0.1", "priority": 0, "ttl": 7200})
+        self.assertFalse(hasattr(r, "zone"))
+        self.assertRaises(AttributeError, setattr, r, "zone", "example.com")
+        soa = DNSSOARecord("ns1", "hostmaster", "5", ttl=300).to_dict()
+        self.assertEqual((soa["type"], soa["primary"], soa["serial"],
+            soa["ttl"]), ("SOA", "ns1", "5", 300))
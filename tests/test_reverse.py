@@ -0,0 +1,68 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova_dns.listener.simple.reverse import ReverseZones, nibbles, ip2int
+
+#RFC 3596 example address
+IP6 = "4321:0:1:2:3:4:567:89ab"
+IP6_ARPA = ("b.a.9.8.7.6.5.0.4.0.0.0.3.0.0.0.2.0.0.0.1.0.0.0.0.0.0.0.1.2.3.4"
+    ".ip6.arpa")
+
+
+class TestCase(tests.TestCase):
+    def test_nibbles(self):
+        self.assertEqual(nibbles(0x1234, 4), "4.3.2.1")
+        self.assertEqual(nibbles(0x1234, 3), "4.3.2")
+        self.assertEqual(nibbles(0xab, 1), "b")
+        self.assertEqual(nibbles(ip2int(IP6)[1], 32) + ".ip6.arpa", IP6_ARPA)
+
+    def test_ipv4(self):
+        zones = ReverseZones(["10.1.2.0/24", "10.1.2.128/26"])
+        #default /24 zone
+        self.assertEqual(zones.lookup("192.168.1.7"),
+            ("1.168.192.in-addr.arpa", 7))
+        #longest prefix wins
+        self.assertEqual(zones.lookup("10.1.2.130"),
+            ("128-26.2.1.10.in-addr.arpa", 130))
+        self.assertEqual(zones.lookup("10.1.2.200"),
+            ("0-24.2.1.10.in-addr.arpa", 200))
+        self.assertEqual(zones.lookup_many(["10.1.2.130", "192.168.1.7"]),
+            [zones.lookup("10.1.2.130"), zones.lookup("192.168.1.7")])
+
+    def test_ipv6(self):
+        #default /64 zone
+        (zone, name) = ReverseZones([]).lookup(IP6)
+        self.assertEqual(zone, "2.0.0.0.1.0.0.0.0.0.0.0.1.2.3.4.ip6.arpa")
+        self.assertEqual(name + "." + zone, IP6_ARPA)
+        zones = ReverseZones(["4321:0:1::/48", "4321:0:1::/52"])
+        #odd number of nibbles in zone name
+        self.assertEqual(zones.lookup(IP6),
+            ("0.1.0.0.0.0.0.0.0.1.2.3.4.ip6.arpa",
+            "b.a.9.8.7.6.5.0.4.0.0.0.3.0.0.0.2.0.0"))
+        self.assertEqual(zones.lookup("4321:0:1:f000::1"),
+            ("1.0.0.0.0.0.0.0.1.2.3.4.ip6.arpa",
+            "1.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.0.f"))
+        self.assertRaises(ValueError, ReverseZones, ["4321:0:1::/50"])
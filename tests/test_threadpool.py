@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import thread
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova_dns import metrics
+from nova_dns.dnsmanager import DNSRecord
+from nova_dns.dnsmanager import memory
+from nova_dns.dnsmanager import threadpool
+
+
+class TestCase(tests.TestCase):
+    def setUp(self):
+        super(TestCase, self).setUp()
+        self.stubs.Set(memory, "ZONES", {})
+        self.threads = []
+        self.manager = memory.Manager()
+        self.stubs.Set(self.manager, "release",
+            lambda: self.threads.append(thread.get_ident()))
+        self.pool = threadpool.ThreadPoolManager(self.manager)
+
+    def test_manager(self):
+        self.pool.add("example.com")
+        zone = self.pool.get("example.com")
+        self.assertEqual(zone.zone_name, "example.com")
+        self.assertEqual(zone.batch([("add", DNSRecord("www", "A",
+            "10.0.0.1")), ("delete", "none", "A")])[0], "ok")
+        zone.add_many([DNSRecord("host%d" % i, "A", "10.0.1.%d" % i)
+            for i in range(5)])
+        self.assertEqual(len(list(zone.iter(type="A"))), 6)
+        self.assertEqual(len(list(self.pool.dump(["A"]))), 6)
+        self.assertEqual(self.pool.list(), ["example.com"])
+        #every call is done and released in pool thread
+        self.assertTrue(self.threads)
+        self.assertFalse(thread.get_ident() in self.threads)
+        self.assertRaises(Exception, self.pool.get, "unknown.com")
+
+    def test_operation(self):
+        seen = []
+        self.stubs.Set(self.manager, "list",
+            lambda: seen.append(metrics.current_operation()))
+        with metrics.operation("zone_list"):
+            self.pool.list()
+        self.assertEqual(seen, ["zone_list"])
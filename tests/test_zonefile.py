@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+#    Nova DNS
+#    Copyright (C) GridDynamics Openstack Core Team, GridDynamics
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU Lesser General Public License as published by
+#    the Free Software Foundation, either version 2.1 of the License, or
+#    (at your option) any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU Lesser General Public License for more details.
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+
+import webob
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tests
+
+from nova_dns import dns
+from nova_dns import zonefile
+from nova_dns.dnsmanager import memory
+
+from nova import flags
+FLAGS = flags.FLAGS
+
+ZONE = """$ORIGIN example.com.
+$TTL 1h
+@   IN  SOA ns1 hostmaster.example.com. (
+        2012041201 ; serial
+        3h 1h 1w
+        300 )
+    IN  NS  ns1
+    600 IN  MX  10 mail.example.com.
+www     A   10.0.0.1
+        AAAA    fe80::1
+txt IN 60 TXT "v=spf1 \\"quoted\\"" " -all"
+_sip._tcp   SRV 10 20 5060 sip
+$ORIGIN sub.example.com.
+host    CNAME   @
+"""
+
+
+class TestAuth():
+    def can(self, req, zone_name):
+        return {"read": True, "write": True}
+
+
+class TestCase(tests.TestCase):
+    def test_parse(self):
+        records = list(zonefile.parse(ZONE.splitlines(True), "example.com"))
+        soa = records.pop(0)
+        self.assertEqual((soa.primary, soa.hostmaster, soa.serial,
+            soa.refresh, soa.retry, soa.expire, soa.ttl),
+            ("ns1.example.com", "hostmaster.example.com", "2012041201",
+            10800, 3600, 604800, 300))
+        self.assertEqual([(r.name, r.type, r.content, r.priority, r.ttl)
+            for r in records], [
+            ("", "NS", "ns1.example.com", 0, 3600),
+            ("", "MX", "mail.example.com", 10, 600),
+            ("www", "A", "10.0.0.1", 0, 3600),
+            ("www", "AAAA", "fe80::1", 0, 3600),
+            ("txt", "TXT", 'v=spf1 "quoted" -all', 0, 60),
+            ("_sip._tcp", "SRV", "20 5060 sip.example.com", 10, 3600),
+            ("host.sub", "CNAME", "sub.example.com", 0, 3600)])
+
+    def test_errors(self):
+        def parse(text):
+            return list(zonefile.parse(text.splitlines(True), "example.com"))
+        self.assertRaisesRegexp(Exception, "line 1: SOA",
+            parse, "www A 10.0.0.1\n")
+        self.assertRaisesRegexp(Exception, "line 2: .*out of zone",
+            parse, "@ SOA ns1 hm 1 2 3 4 5\nwww.other.com. A 10.0.0.1\n")
+        self.assertRaisesRegexp(Exception, "line 2: Incorrect type",
+            parse, "@ SOA ns1 hm 1 2 3 4 5\nwww WRONG 10.0.0.1\n")
+        self.assertRaisesRegexp(Exception, "line 1: unbalanced",
+            parse, "@ SOA ns1 hm ( 1 2 3 4 5\n")
+
+    def test_export_import(self):
+        FLAGS.dns_manager = "nova_dns.dnsmanager.memory.Manager"
+        self.stubs.Set(memory, "ZONES", {})
+        self.stubs.Set(dns, "AUTH", TestAuth())
+        app = dns.VersionFilter(dns.App())
+
+        def call(path, method="GET", body=None):
+            request = webob.Request.blank(path)
+            request.method = method
+            if body is not None:
+                request.body = body
+            return request.get_response(app)
+
+        res = call("/zone/example.com/import", "POST", ZONE)
+        self.assertEqual(res.body, '{"result": "ok", "error": null}')
+        self.assertEqual(len(memory.MemoryZone("example.com").get()), 8)
+        exported = call("/zone/example.com/export").body
+        self.assertTrue("\nwww\t3600\tIN\tA\t10.0.0.1\n" in exported)
+        self.assertTrue('\ttxt\t' not in exported)
+
+        #exported zone is loaded back with the same records
+        memory.ZONES.clear()
+        self.assertEqual(call("/zone/example.com/import", "POST",
+            exported).status_int, 200)
+        self.assertEqual(call("/zone/example.com/export").body.split("\n")[2:],
+            exported.split("\n")[2:])
+
+        #failed import doesn't leave zone
+        res = call("/zone/other.com/import", "POST",
+            "@ SOA ns1 hm 1 2 3 4 5\nwww WRONG 10.0.0.1\n")
+        self.assertTrue("Incorrect type" in res.body)
+        self.assertFalse("other.com" in memory.ZONES)